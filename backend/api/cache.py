@@ -0,0 +1,270 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from recipes.batching import on_commit_once
+from rest_framework import status
+from rest_framework.response import Response
+
+GENERATION_KEY = 'api:generation:{}'
+MODIFIED_KEY = 'api:modified:{}'
+TAG_SLUGS_KEY = 'api:tag-slugs'
+FRAGMENT_KEY = 'api:fragment:recipe:{}:{}'
+
+
+def new_generation():
+    """Новый токен поколения.
+
+    Поколения хранятся в том же кеше, что и данные, и могут быть
+    вытеснены. Счётчик после вытеснения начался бы заново и повторил
+    старые номера, под которыми ещё лежат устаревшие ответы, поэтому
+    токеном служит время в наносекундах, которое не повторяется.
+    """
+    return time.time_ns()
+
+
+def get_generation(scope):
+    """Текущее поколение кеша для области scope."""
+    return cache.get_or_set(
+        GENERATION_KEY.format(scope), new_generation, timeout=None,
+    )
+
+
+def bump_generation(*scopes):
+    """Инвалидация кеша областей scopes сменой поколения."""
+    now = time.time()
+    cache.set_many({
+        key: value
+        for scope in scopes
+        for key, value in (
+            (GENERATION_KEY.format(scope), new_generation()),
+            (MODIFIED_KEY.format(scope), now),
+        )
+    }, timeout=None)
+
+
+def _bump_scopes(scopes):
+    bump_generation(*scopes)
+
+
+def bump_on_commit(*scopes):
+    """Смена поколений scopes после коммита текущей транзакции.
+
+    До коммита другие запросы ещё видят старые данные и не должны
+    кешировать их под новым поколением. Области, накопленные за
+    транзакцию, сбрасываются одним вызовом и забываются при её откате.
+    """
+    on_commit_once(_bump_scopes, scopes)
+
+
+def get_versions(scopes):
+    """Поколения и время последнего изменения областей scopes."""
+    keys = [GENERATION_KEY.format(scope) for scope in scopes]
+    keys += [MODIFIED_KEY.format(scope) for scope in scopes]
+    stored = cache.get_many(keys)
+    now = time.time()
+    missing = {
+        key: now if index >= len(scopes) else new_generation()
+        for index, key in enumerate(keys)
+        if key not in stored
+    }
+    if missing:
+        cache.set_many(missing, timeout=None)
+        stored.update(missing)
+    generations = [stored[key] for key in keys[:len(scopes)]]
+    return generations, max(stored[key] for key in keys[len(scopes):])
+
+
+def get_generations(scopes):
+    """Поколения нескольких областей одним обращением к кешу."""
+    keys = {scope: GENERATION_KEY.format(scope) for scope in scopes}
+    stored = cache.get_many(keys.values())
+    missing = {
+        key: new_generation() for key in keys.values() if key not in stored
+    }
+    if missing:
+        cache.set_many(missing, timeout=None)
+        stored.update(missing)
+    return {scope: stored[key] for scope, key in keys.items()}
+
+
+def recipe_fragment_keys(rows):
+    """Ключи кеша независимых от пользователя фрагментов рецептов.
+
+    В ключ входят поколения рецепта, его автора и общее поколение
+    fragments, которое меняется при правках справочников и массовых
+    операциях, поэтому любое изменение данных рецепта даёт новый ключ.
+    """
+    scopes = {'fragments'}
+    for row in rows:
+        scopes.add(f'recipe:{row["id"]}')
+        scopes.add(f'author:{row["author_id"]}')
+    generations = get_generations(scopes)
+    return {
+        row['id']: FRAGMENT_KEY.format(row['id'], '.'.join(map(str, (
+            generations[f'recipe:{row["id"]}'],
+            generations[f'author:{row["author_id"]}'],
+            generations['fragments'],
+        ))))
+        for row in rows
+    }
+
+
+def get_recipe_fragments(keys):
+    """Закешированные фрагменты по словарю {id рецепта: ключ}."""
+    stored = cache.get_many(keys.values())
+    return {
+        recipe_id: stored[key]
+        for recipe_id, key in keys.items()
+        if key in stored
+    }
+
+
+def set_recipe_fragments(keys, fragments):
+    cache.set_many(
+        {keys[recipe_id]: data for recipe_id, data in fragments.items()},
+        settings.RECIPE_FRAGMENT_TIMEOUT,
+    )
+
+
+def get_tag_ids_by_slug():
+    """Соответствие слагов тегов их идентификаторам.
+
+    Срок хранения ограничен на случай, если карту успели закешировать
+    по данным ещё не закоммиченной транзакции.
+    """
+    from recipes.models import Tag
+
+    slugs = cache.get(TAG_SLUGS_KEY)
+    if slugs is None:
+        slugs = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(TAG_SLUGS_KEY, slugs, settings.API_CACHE_TIMEOUT)
+    return slugs
+
+
+def invalidate_tag_slugs():
+    cache.delete(TAG_SLUGS_KEY)
+
+
+def normalized_url(request):
+    """Адрес запроса с отсортированными параметрами."""
+    params = urlencode(sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+    ))
+    return f'{request.get_host()}{request.path}?{params}'
+
+
+class NotModified(Exception):
+    """Прерывание обработки запроса ответом 304."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """Поддержка If-None-Match и If-Modified-Since.
+
+    Валидаторы строятся из поколений областей condition_scopes и
+    поколения текущего пользователя без обращения к сериализаторам,
+    поэтому ответ 304 отдаётся до выполнения обработчика.
+    """
+
+    condition_scopes = ()
+    condition_actions = ('list', 'retrieve')
+    condition_per_user = True
+
+    etag = None
+    last_modified = None
+
+    def get_condition_scopes(self, request):
+        scopes = list(self.condition_scopes)
+        if self.condition_per_user and request.user.is_authenticated:
+            scopes.append(f'user:{request.user.pk}')
+        return scopes
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            request.method not in ('GET', 'HEAD')
+            or self.action not in self.condition_actions
+        ):
+            return
+        scopes = self.get_condition_scopes(request)
+        generations, modified = get_versions(scopes)
+        validator = '{}:{}:{}:{}'.format(
+            request.user.pk,
+            scopes,
+            generations,
+            normalized_url(request),
+        )
+        self.etag = quote_etag(hashlib.md5(validator.encode()).hexdigest())
+        self.last_modified = int(modified)
+        response = get_conditional_response(
+            request,
+            etag=self.etag,
+            last_modified=self.last_modified,
+        )
+        if response is not None:
+            raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs,
+        )
+        if self.etag and response.status_code in (
+            status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED,
+        ):
+            response['ETag'] = self.etag
+            response['Last-Modified'] = http_date(self.last_modified)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class AnonymousCacheMixin:
+    """Кеширование ответов list/retrieve для анонимных пользователей.
+
+    Ключ строится из области кеша, её текущего поколения, действия,
+    пути и нормализованной строки запроса.
+    """
+
+    cache_scope = None
+
+    def get_cache_key(self, request):
+        url = normalized_url(request)
+        return 'api:response:{}:{}:{}:{}'.format(
+            self.cache_scope,
+            get_generation(self.cache_scope),
+            self.action,
+            hashlib.md5(url.encode()).hexdigest(),
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs,
+        )
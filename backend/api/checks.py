@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Предупреждение о кеше, который не виден другим процессам.
+
+    Сброс кеша API сменой поколения из одного процесса не доходит до
+    остальных воркеров и не действует после management-команд.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'Кеш {backend} не разделяется между процессами: воркеры и '
+        'management-команды не увидят сброс кеша друг друга.',
+        hint='Используйте CACHE_BACKEND=file или redis, если запущено '
+             'больше одного процесса.',
+        id='api.W001',
+    )]
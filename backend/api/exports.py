@@ -0,0 +1,186 @@
+import csv
+import logging
+import textwrap
+import threading
+from collections import namedtuple
+from concurrent import futures
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Sum
+from PIL import Image, ImageDraw, ImageFont
+from recipes.models import RecipeIngredient, ShoppingCart
+
+from api.cache import bump_generation, get_generations
+
+logger = logging.getLogger(__name__)
+
+EXPORT_KEY = 'api:shopping-list:{}:{}:{}'
+
+# A4 при 150 dpi.
+PDF_PAGE_SIZE = (1240, 1754)
+PDF_RESOLUTION = 150
+PDF_MARGIN = 100
+PDF_FONT_SIZE = 28
+PDF_LINE_HEIGHT = 42
+PDF_LINE_WIDTH = 64
+
+executor = futures.ThreadPoolExecutor(
+    max_workers=settings.SHOPPING_LIST_EXPORT_WORKERS,
+    thread_name_prefix='shopping-list',
+)
+_pending = {}
+_pending_lock = threading.RLock()
+
+
+def cart_scopes(user_id):
+    """Области кеша, от которых зависит список покупок пользователя."""
+    return [f'cart:{user_id}', 'ingredients']
+
+
+def bump_cart_versions(recipe_ids):
+    """Смена версии корзин, в которых лежат рецепты recipe_ids."""
+    user_ids = ShoppingCart.objects.filter(
+        recipe_id__in=recipe_ids,
+    ).values_list('user_id', flat=True).distinct()
+    bump_generation(*(f'cart:{user_id}' for user_id in user_ids))
+
+
+def shopping_list(user_id):
+    """Ингредиенты корзины пользователя с суммарным количеством."""
+    return list(
+        RecipeIngredient.objects
+        .filter(recipe__shoppingcart_set__user_id=user_id)
+        .values_list('ingredient__name', 'ingredient__measurement_unit')
+        .annotate(total_amount=Sum('amount'))
+        .order_by('ingredient__name')
+    )
+
+
+def text_lines(items):
+    return [f'{name} ({unit}) — {total}' for name, unit, total in items]
+
+
+def render_txt(items):
+    return '\n'.join(text_lines(items)).encode()
+
+
+def render_csv(items):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    writer.writerows(items)
+    # BOM нужен Excel, чтобы распознать UTF-8.
+    return buffer.getvalue().encode('utf-8-sig')
+
+
+def load_pdf_font():
+    try:
+        return ImageFont.truetype(
+            settings.SHOPPING_LIST_PDF_FONT, PDF_FONT_SIZE,
+        )
+    except OSError:
+        logger.warning(
+            'Шрифт %s не найден, кириллица в PDF не отобразится',
+            settings.SHOPPING_LIST_PDF_FONT,
+        )
+        return ImageFont.load_default()
+
+
+def render_pdf(items):
+    """PDF со страницами-изображениями, отрисованными Pillow.
+
+    Монохромные страницы сохраняются без потерь в CCITT, поэтому файл
+    остаётся небольшим и не требует отдельной PDF-библиотеки.
+    """
+    font = load_pdf_font()
+    lines = ['Список покупок', '']
+    for line in text_lines(items):
+        lines += textwrap.wrap(
+            line, PDF_LINE_WIDTH, subsequent_indent='    ',
+        )
+    per_page = (PDF_PAGE_SIZE[1] - 2 * PDF_MARGIN) // PDF_LINE_HEIGHT
+    pages = []
+    for start in range(0, len(lines), per_page):
+        page = Image.new('1', PDF_PAGE_SIZE, 1)
+        draw = ImageDraw.Draw(page)
+        for row, line in enumerate(lines[start:start + per_page]):
+            draw.text(
+                (PDF_MARGIN, PDF_MARGIN + row * PDF_LINE_HEIGHT),
+                line, font=font, fill=0,
+            )
+        pages.append(page)
+    buffer = BytesIO()
+    pages[0].save(
+        buffer, 'PDF', save_all=True, append_images=pages[1:],
+        resolution=PDF_RESOLUTION, title='Список покупок',
+    )
+    return buffer.getvalue()
+
+
+ExportFormat = namedtuple(
+    'ExportFormat', ('content_type', 'render', 'background'),
+)
+
+EXPORT_FORMATS = {
+    'txt': ExportFormat('text/plain; charset=utf-8', render_txt, False),
+    'csv': ExportFormat('text/csv; charset=utf-8', render_csv, True),
+    'pdf': ExportFormat('application/pdf', render_pdf, True),
+}
+
+
+def export_key(user_id, export_format):
+    scopes = cart_scopes(user_id)
+    generations = get_generations(scopes)
+    return EXPORT_KEY.format(user_id, export_format, '.'.join(
+        str(generations[scope]) for scope in scopes
+    ))
+
+
+def build_export(user_id, export_format, key):
+    content = EXPORT_FORMATS[export_format].render(shopping_list(user_id))
+    cache.set(key, content, settings.SHOPPING_LIST_EXPORT_TIMEOUT)
+    return content
+
+
+def _run_in_worker(*args):
+    try:
+        return build_export(*args)
+    finally:
+        close_old_connections()
+
+
+def _forget_pending(key):
+    with _pending_lock:
+        _pending.pop(key, None)
+
+
+def get_export(user_id, export_format):
+    """Содержимое выгрузки списка покупок в формате export_format.
+
+    Выгрузка кешируется по версии корзины, поэтому повторное скачивание
+    неизменной корзины не обращается к базе. Тяжёлые форматы строятся в
+    фоновом пуле: одновременные запросы одной версии ждут общую задачу,
+    а если она не успела за SHOPPING_LIST_EXPORT_WAIT секунд,
+    возвращается None.
+    """
+    key = export_key(user_id, export_format)
+    content = cache.get(key)
+    if content is not None:
+        return content
+    if not EXPORT_FORMATS[export_format].background:
+        return build_export(user_id, export_format, key)
+    with _pending_lock:
+        future = _pending.get(key)
+        if future is None:
+            future = executor.submit(
+                _run_in_worker, user_id, export_format, key,
+            )
+            _pending[key] = future
+            future.add_done_callback(lambda _: _forget_pending(key))
+    try:
+        return future.result(timeout=settings.SHOPPING_LIST_EXPORT_WAIT)
+    except futures.TimeoutError:
+        return None
@@ -1,5 +1,8 @@
+from api.cache import get_tag_ids_by_slug
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 from recipes.models import Ingredient, Recipe
+from recipes.search import search_recipes
 
 
 class IngredientFilter(FilterSet):
@@ -19,10 +22,15 @@ class IngredientFilter(FilterSet):
 class RecipeFilter(FilterSet):
     """Фильтр для рецептов."""
 
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug',
+    tags = filters.MultipleChoiceFilter(
+        choices=lambda: [(slug, slug) for slug in get_tag_ids_by_slug()],
+        method='filter_tags',
         help_text='Фильтрация по слагам тегов',
     )
+    search = filters.CharFilter(
+        method='filter_search',
+        help_text='Полнотекстовый поиск по названию, ингредиентам и описанию',
+    )
     is_favorited = filters.BooleanFilter(
         field_name='is_favorited',
         help_text='Фильтр по избранному',
@@ -39,8 +47,29 @@ class RecipeFilter(FilterSet):
             'author',
             'is_favorited',
             'is_in_shopping_cart',
+            'search',
         ]
 
+    def filter_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов без JOIN и DISTINCT.
+
+        Тег может быть удалён после проверки слагов, такие слаги
+        пропускаются.
+        """
+        tag_ids = get_tag_ids_by_slug()
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag_id__in=[
+                    tag_id for tag_id in map(tag_ids.get, value)
+                    if tag_id is not None
+                ],
+            )
+        ))
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
     def filter_queryset(self, queryset):
         """Отключение фильтров для анонимных пользователей."""
         if not self.request.user.is_authenticated:
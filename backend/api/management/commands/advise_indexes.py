@@ -0,0 +1,336 @@
+import json
+import random
+import re
+from collections import defaultdict
+
+from api.management.commands import benchmark_api
+from django.apps import apps
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import UniqueConstraint
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+VALUES_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+TABLE_ALIAS = re.compile(r'(?:FROM|JOIN) "(\w+)"(?: (?:AS )?"?(\w+)"?)?')
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS (\w+))?$')
+SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR ORDER BY')
+ORDER_BY = re.compile(r'ORDER BY ((?:(?!ORDER BY).)+?)(?: LIMIT| OFFSET|$)')
+ORDER_COLUMN = re.compile(r'"?(\w+)"?\."(\w+)"(?: (ASC|DESC))?')
+
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+def normalize(sql):
+    """Форма запроса без конкретных значений параметров."""
+    sql = LITERAL.sub('?', sql)
+    return ' '.join(VALUES_LIST.sub('(...)', sql).split())
+
+
+def table_aliases(sql):
+    """Соответствие псевдонимов таблиц запроса их именам."""
+    aliases = {}
+    for table, alias in TABLE_ALIAS.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in ('ON', 'WHERE', 'INNER', 'LEFT'):
+            aliases[alias] = table
+    return aliases
+
+
+def order_columns(sql):
+    """Столбцы внешней сортировки запроса: [(псевдоним, столбец, DESC)]."""
+    orders = ORDER_BY.findall(sql)
+    if not orders:
+        return []
+    return [
+        (alias, column, direction == 'DESC')
+        for alias, column, direction in ORDER_COLUMN.findall(orders[-1])
+    ]
+
+
+def suggest_columns(sql, alias):
+    """Столбцы таблицы из условий равенства и сортировки запроса.
+
+    Сначала идут столбцы из условий = и IN, затем столбцы сортировки:
+    такой составной индекс одновременно отбирает строки и отдаёт их в
+    нужном порядке.
+    """
+    columns = []
+    # Соединения t1.col = t2.col и подзапросы не отбирают строки.
+    condition = (
+        rf'"?{re.escape(alias)}"?\."(\w+)" (?:=|IN) '
+        r'(?!"?\w+"?\."|\(SELECT)'
+    )
+    for column in re.findall(condition, sql):
+        if column not in columns:
+            columns.append(column)
+    for order_alias, column, descending in order_columns(sql):
+        if order_alias == alias and column not in columns:
+            columns.append(f'-{column}' if descending else column)
+    return columns
+
+
+def model_indexes(model):
+    """Столбцы существующих индексов модели: [(имя, [столбцы])].
+
+    Учитываются индексы и уникальные ограничения из Meta, а также
+    индексы отдельных полей (первичный ключ, unique, db_index и внешние
+    ключи). Столбцы с убывающим порядком начинаются с «-».
+    """
+    opts = model._meta
+
+    def columns(fields):
+        return [
+            '{}{}'.format(
+                '-' if name.startswith('-') else '',
+                opts.get_field(name.lstrip('-')).column,
+            )
+            for name in fields
+        ]
+
+    indexes = [(index.name, columns(index.fields)) for index in opts.indexes]
+    indexes += [
+        (constraint.name, columns(constraint.fields))
+        for constraint in opts.constraints
+        if isinstance(constraint, UniqueConstraint)
+        and constraint.condition is None
+    ]
+    indexes += [
+        (', '.join(fields), columns(fields))
+        for fields in (*opts.unique_together, *opts.index_together)
+    ]
+    indexes += [
+        (field.name, [field.column]) for field in opts.concrete_fields
+        if field.primary_key or field.unique or field.db_index
+    ]
+    return indexes
+
+
+def covered_by(columns, indexes):
+    """Имя индекса, ведущие столбцы которого совпадают с columns.
+
+    Индекс читается и в обратном направлении, поэтому подходит и
+    порядок, противоположный по всем столбцам сразу.
+    """
+    flipped = [
+        column[1:] if column.startswith('-') else f'-{column}'
+        for column in columns
+    ]
+    for name, index in indexes:
+        if index[:len(columns)] in (list(columns), flipped):
+            return name
+    return None
+
+
+class Command(benchmark_api.Command):
+    help = (
+        'Прогон запросов API из Postman-коллекции и JSONL-файлов, '
+        'EXPLAIN их SQL и поиск полных сканирований и сортировок '
+        'больших таблиц'
+    )
+
+    def add_arguments(self, parser):
+        self.add_source_arguments(parser)
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help='Таблицы меньшего размера не проверяются',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Прогонов каждого запроса с разными значениями',
+        )
+        parser.add_argument('--show-sql', action='store_true',
+                            help='Вывести пример SQL и план запроса')
+        parser.add_argument('--fail', action='store_true',
+                            help='Завершиться ошибкой при находках')
+
+    def capture(self, entries, fixtures):
+        """SQL всех запросов, сгруппированный по форме.
+
+        Кеш на время прогона отключён, чтобы запросы доходили до базы.
+        """
+        client = Client(HTTP_HOST=self.host)
+        shapes = {}
+        with override_settings(CACHES=NO_CACHE):
+            for entry in entries:
+                headers = {}
+                if entry['auth']:
+                    headers['HTTP_AUTHORIZATION'] = (
+                        f'Token {random.choice(fixtures["token"])}'
+                    )
+                path = self.substitute(entry['path'], fixtures)
+                with CaptureQueriesContext(connection) as queries:
+                    getattr(client, entry['method'].lower())(path, **headers)
+                endpoint = f'{entry["method"]} {entry["path"]}'
+                for query in queries.captured_queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    shape = shapes.setdefault(normalize(sql), {
+                        'sql': sql, 'endpoints': set(),
+                    })
+                    shape['endpoints'].add(endpoint)
+        return shapes
+
+    def explain(self, sql):
+        """Полные сканирования и сортировки из плана запроса.
+
+        Возвращает план и список пар (вид, таблица или псевдоним).
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return plan, list(self.walk_postgres(plan[0]['Plan']))
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [row[-1] for row in cursor.fetchall()]
+        findings = []
+        for detail in plan:
+            scan = SQLITE_SCAN.match(detail)
+            if scan:
+                findings.append(('seq_scan', scan.group(2) or scan.group(1)))
+            if SQLITE_SORT.search(detail):
+                findings.append(('sort', None))
+        return plan, findings
+
+    def walk_postgres(self, node):
+        if node['Node Type'] == 'Seq Scan':
+            yield 'seq_scan', node.get('Alias') or node['Relation Name']
+        elif node['Node Type'] == 'Sort':
+            yield 'sort', None
+        for child in node.get('Plans', ()):
+            yield from self.walk_postgres(child)
+
+    def table_rows(self, table):
+        if table not in self.rows:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}'
+                )
+                self.rows[table] = cursor.fetchone()[0]
+        return self.rows[table]
+
+    def analyze(self, shapes, min_rows):
+        """Находки по таблицам: {(вид, таблица): сведения}."""
+        tables = set(connection.introspection.table_names())
+        report = defaultdict(lambda: {
+            'queries': 0, 'endpoints': set(), 'columns': defaultdict(int),
+            'sql': None, 'plan': None,
+        })
+        for shape in shapes.values():
+            sql = shape['sql']
+            aliases = {
+                alias: table for alias, table in table_aliases(sql).items()
+                if table in tables
+            }
+            try:
+                plan, findings = self.explain(sql)
+            except Exception as error:
+                self.stdout.write(self.style.WARNING(
+                    f'EXPLAIN не выполнен: {error}'
+                ))
+                continue
+            scanned = {alias for kind, alias in findings if kind == 'seq_scan'}
+            for kind, alias in set(findings):
+                if kind == 'sort':
+                    # Сортировка относится к таблице первого столбца
+                    # ORDER BY и дорога, только если сортируется вся
+                    # таблица или из большой выборки берётся страница.
+                    order = order_columns(sql)
+                    alias = order[0][0] if order else None
+                    if alias not in scanned and ' LIMIT ' not in sql:
+                        continue
+                table = aliases.get(alias)
+                if table is None or self.table_rows(table) < min_rows:
+                    continue
+                row = report[kind, table]
+                row['queries'] += 1
+                row['endpoints'] |= shape['endpoints']
+                columns = suggest_columns(sql, alias)
+                if columns:
+                    row['columns'][tuple(columns)] += 1
+                if row['sql'] is None:
+                    row['sql'], row['plan'] = sql, plan
+        return report
+
+    def suggest_index(self, table, columns):
+        """Описание индекса в терминах модели Django.
+
+        Если у модели уже есть индекс с такими ведущими столбцами,
+        возвращается None.
+        """
+        model = next(
+            (
+                model for model in apps.get_models(include_auto_created=True)
+                if model._meta.db_table == table
+            ),
+            None,
+        )
+        if model is None:
+            return f'{table}({", ".join(columns)})'
+        if covered_by(columns, model_indexes(model)):
+            return None
+        names = {
+            field.column: field.name for field in model._meta.concrete_fields
+        }
+        fields = ', '.join(
+            "'{}{}'".format(
+                '-' if column.startswith('-') else '',
+                names.get(column.lstrip('-'), column.lstrip('-')),
+            )
+            for column in columns
+        )
+        return f'{model.__name__}: models.Index(fields=[{fields}])'
+
+    def print_report(self, report, show_sql):
+        titles = {'seq_scan': 'Полное сканирование', 'sort': 'Сортировка'}
+        for (kind, table), row in sorted(
+            report.items(),
+            key=lambda item: -self.rows[item[0][1]] * item[1]['queries'],
+        ):
+            self.stdout.write(self.style.WARNING(
+                f'{titles[kind]}: {table} ({self.rows[table]} строк), '
+                f'запросов: {row["queries"]}'
+            ))
+            for endpoint in sorted(row['endpoints']):
+                self.stdout.write(f'    {endpoint}')
+            for columns, count in sorted(
+                row['columns'].items(), key=lambda item: -item[1],
+            ):
+                suggestion = self.suggest_index(table, columns)
+                if suggestion:
+                    self.stdout.write(
+                        f'    {suggestion} — запросов: {count}'
+                    )
+            if show_sql:
+                self.stdout.write(f'    SQL: {row["sql"]}')
+                plan = row['plan']
+                if not isinstance(plan, list) or not all(
+                    isinstance(line, str) for line in plan
+                ):
+                    plan = [json.dumps(plan, ensure_ascii=False)]
+                for line in plan:
+                    self.stdout.write(f'    план: {line}')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(
+                f'EXPLAIN для {connection.vendor} не поддерживается'
+            )
+        entries = self.load_entries(options)
+        self.host = self.default_host()
+        fixtures = self.load_fixtures(options['users'])
+        self.rows = {}
+        shapes = self.capture(entries * options['repeat'], fixtures)
+        report = self.analyze(shapes, options['min_rows'])
+        self.print_report(report, options['show_sql'])
+        self.stdout.write(
+            f'Проверено форм запросов: {len(shapes)}, находок: {len(report)}'
+        )
+        if report and options['fail']:
+            raise CommandError(f'Обнаружено проблем: {len(report)}')
@@ -0,0 +1,346 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+VARIABLE = re.compile(r'{{\s*(\w+)\s*}}')
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Перцентиль по методу ближайшего ранга."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, int(round(rank / 100 * len(ordered))) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон API по запросам из Postman-коллекции и '
+        'JSONL-файлов с отчётом по задержкам и SQL-запросам'
+    )
+
+    def add_source_arguments(self, parser):
+        """Аргументы источников запросов, общие с advise_indexes."""
+        parser.add_argument(
+            '--postman',
+            default=str(
+                settings.BASE_DIR.parent / 'postman_collection'
+                / 'foodgram.postman_collection.json'
+            ),
+            help='Путь до Postman-коллекции ("" — не использовать)',
+        )
+        parser.add_argument(
+            '--jsonl',
+            action='append',
+            default=[],
+            help='JSONL-файл со строками вида {"method": "GET", '
+                 '"path": "/api/recipes/", "auth": true, "weight": 1}',
+        )
+        parser.add_argument(
+            '--methods',
+            default='GET',
+            help='Воспроизводимые HTTP-методы через запятую',
+        )
+        parser.add_argument('--users', type=int, default=20,
+                            help='Количество пользователей с токенами')
+
+    def add_arguments(self, parser):
+        self.add_source_arguments(parser)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--clear-cache', action='store_true',
+                            help='Очистить кеш перед прогоном')
+        parser.add_argument('--save', help='Сохранить результаты в JSON')
+        parser.add_argument('--baseline',
+                            help='Сравнить с сохранёнными результатами')
+        parser.add_argument(
+            '--threshold', type=float, default=20.0,
+            help='Допустимое ухудшение p95 и числа запросов, %%',
+        )
+
+    def load_postman(self, path):
+        with open(path, encoding='utf-8') as file:
+            collection = json.load(file)
+        entries = []
+
+        def walk(items, auth):
+            for item in items:
+                item_auth = (item.get('auth') or {}).get('type', auth)
+                if 'item' in item:
+                    walk(item['item'], item_auth)
+                    continue
+                request = item['request']
+                request_auth = (request.get('auth') or {}).get(
+                    'type', item_auth,
+                )
+                url = request['url']
+                raw = url['raw'] if isinstance(url, dict) else url
+                entries.append({
+                    'method': request['method'].upper(),
+                    'path': raw.replace('{{baseUrl}}', ''),
+                    'body': (request.get('body') or {}).get('raw'),
+                    'auth': request_auth == 'apikey',
+                    'weight': 1,
+                })
+
+        walk(collection.get('item', []), None)
+        return entries
+
+    def load_jsonl(self, path):
+        entries = []
+        with open(path, encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if 'path' not in entry:
+                    self.stdout.write(self.style.WARNING(
+                        f'{path}:{number}: нет поля path, строка пропущена'
+                    ))
+                    continue
+                entries.append({
+                    'method': entry.get('method', 'GET').upper(),
+                    'path': entry['path'],
+                    'body': entry.get('body'),
+                    'auth': bool(entry.get('auth')),
+                    'weight': entry.get('weight', 1),
+                })
+        return entries
+
+    def load_entries(self, options):
+        """Запросы из всех источников с отбором по HTTP-методам."""
+        entries = []
+        if options['postman']:
+            entries += self.load_postman(options['postman'])
+        for path in options['jsonl']:
+            entries += self.load_jsonl(path)
+        methods = {
+            method.strip().upper()
+            for method in options['methods'].split(',')
+        }
+        entries = [entry for entry in entries if entry['method'] in methods]
+        if not entries:
+            raise CommandError('Нет запросов для воспроизведения')
+        return entries
+
+    def default_host(self):
+        return next(
+            (
+                host for host in settings.ALLOWED_HOSTS
+                if host and not host.startswith('.') and host != '*'
+            ),
+            'localhost',
+        )
+
+    def load_fixtures(self, users_count):
+        """Значения для подстановки переменных коллекции из базы."""
+        users = list(User.objects.order_by('?')[:users_count])
+        fixtures = {
+            'user': [user.pk for user in users],
+            'token': [
+                Token.objects.get_or_create(user=user)[0].key
+                for user in users
+            ],
+            'tag': list(Tag.objects.values_list('pk', flat=True)),
+            'slug': list(Tag.objects.values_list('slug', flat=True)),
+            'recipe': list(Recipe.objects.order_by('?').values_list(
+                'pk', flat=True,
+            )[:1000]),
+            'ingredient': list(Ingredient.objects.order_by('?').values_list(
+                'pk', 'name',
+            )[:1000]),
+        }
+        if not fixtures['token'] or not fixtures['recipe']:
+            raise CommandError(
+                'База пуста: заполните её командой generate_dataset'
+            )
+        return fixtures
+
+    def substitute(self, text, fixtures):
+        def value(match):
+            name = match.group(1).lower()
+            if name.endswith('slug'):
+                return random.choice(fixtures['slug'])
+            if 'tag' in name:
+                return str(random.choice(fixtures['tag']))
+            if 'recipe' in name:
+                return str(random.choice(fixtures['recipe']))
+            if 'ingredient' in name or 'indredient' in name:
+                pk, title = random.choice(fixtures['ingredient'])
+                return title[:1] if 'name' in name else str(pk)
+            if 'user' in name and name.endswith('id'):
+                return str(random.choice(fixtures['user']))
+            return match.group(0)
+
+        return VARIABLE.sub(value, text)
+
+    def run_one(self, entry, fixtures, local):
+        if not hasattr(local, 'client'):
+            local.client = Client(HTTP_HOST=self.host)
+        headers = {}
+        if entry['auth']:
+            headers['HTTP_AUTHORIZATION'] = (
+                f'Token {random.choice(fixtures["token"])}'
+            )
+        path = self.substitute(entry['path'], fixtures)
+        body = entry['body']
+        if isinstance(body, str):
+            body = self.substitute(body, fixtures)
+        elif body is not None:
+            body = json.dumps(body)
+        method = getattr(local.client, entry['method'].lower())
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if body is None:
+                response = method(path, **headers)
+            else:
+                response = method(
+                    path, body, content_type='application/json', **headers,
+                )
+            elapsed = time.perf_counter() - started
+        return {
+            'endpoint': f'{entry["method"]} {entry["path"]}',
+            'status': response.status_code,
+            'latency': elapsed * 1000,
+            'queries': len(queries.captured_queries),
+            'sql_time': sum(
+                float(query['time']) for query in queries.captured_queries
+            ) * 1000,
+        }
+
+    def worker(self, jobs, fixtures, lock):
+        local = threading.local()
+        results = []
+        try:
+            while True:
+                with lock:
+                    entry = next(jobs, None)
+                if entry is None:
+                    return results
+                results.append(self.run_one(entry, fixtures, local))
+        finally:
+            connection.close()
+
+    def summarize(self, results, wall_time):
+        grouped = defaultdict(list)
+        for result in results:
+            grouped[result['endpoint']].append(result)
+        summary = {}
+        for endpoint, rows in sorted(grouped.items()):
+            latencies = [row['latency'] for row in rows]
+            summary[endpoint] = {
+                'requests': len(rows),
+                'errors': sum(row['status'] >= 500 for row in rows),
+                'statuses': sorted({row['status'] for row in rows}),
+                'rps': round(len(rows) / wall_time, 2),
+                **{
+                    f'p{rank}': round(percentile(latencies, rank), 2)
+                    for rank in PERCENTILES
+                },
+                'queries': round(
+                    sum(row['queries'] for row in rows) / len(rows), 2,
+                ),
+                'sql_ms': round(
+                    sum(row['sql_time'] for row in rows) / len(rows), 2,
+                ),
+            }
+        return summary
+
+    def report(self, summary, wall_time, total):
+        self.stdout.write(
+            f'{"Эндпоинт":<60} {"N":>5} {"RPS":>7} {"p50":>8} {"p95":>8} '
+            f'{"p99":>8} {"SQL":>6} {"SQL мс":>7} {"5xx":>4}'
+        )
+        for endpoint, row in summary.items():
+            self.stdout.write(
+                f'{endpoint[:60]:<60} {row["requests"]:>5} {row["rps"]:>7} '
+                f'{row["p50"]:>8} {row["p95"]:>8} {row["p99"]:>8} '
+                f'{row["queries"]:>6} {row["sql_ms"]:>7} {row["errors"]:>4}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего {total} запросов за {wall_time:.2f} с '
+            f'({total / wall_time:.1f} запросов/с)'
+        ))
+
+    def compare(self, summary, path, threshold):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['endpoints']
+        regressions = []
+        for endpoint, row in summary.items():
+            base = baseline.get(endpoint)
+            if not base:
+                continue
+            for metric in ('p95', 'queries'):
+                limit = base[metric] * (1 + threshold / 100)
+                if row[metric] > limit and row[metric] - base[metric] > 0.5:
+                    regressions.append(
+                        f'{endpoint}: {metric} {base[metric]} → '
+                        f'{row[metric]}'
+                    )
+        for line in regressions:
+            self.stdout.write(self.style.ERROR(line))
+        if regressions:
+            raise CommandError(
+                f'Обнаружено регрессий: {len(regressions)}'
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий не обнаружено'))
+
+    def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+        entries = self.load_entries(options)
+        self.host = self.default_host()
+        fixtures = self.load_fixtures(options['users'])
+        if options['clear_cache']:
+            cache.clear()
+        jobs = iter(random.choices(
+            entries,
+            weights=[entry['weight'] for entry in entries],
+            k=options['requests'],
+        ))
+        lock = threading.Lock()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            futures = [
+                pool.submit(self.worker, jobs, fixtures, lock)
+                for _ in range(options['concurrency'])
+            ]
+            results = [row for future in futures for row in future.result()]
+        wall_time = time.perf_counter() - started
+
+        summary = self.summarize(results, wall_time)
+        self.report(summary, wall_time, len(results))
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as file:
+                json.dump(
+                    {
+                        'requests': len(results),
+                        'concurrency': options['concurrency'],
+                        'wall_time': round(wall_time, 3),
+                        'endpoints': summary,
+                    },
+                    file,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+        if options['baseline']:
+            self.compare(summary, options['baseline'], options['threshold'])
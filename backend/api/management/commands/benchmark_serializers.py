@@ -0,0 +1,61 @@
+import json
+import time
+
+from api.serializers import RecipeReadSerializer, RecipeValuesSerializer
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+def render(data):
+    return json.dumps(data, ensure_ascii=False).encode()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение скорости RecipeValuesSerializer и RecipeReadSerializer; '
+        'совпадение их ответов проверяется тестами api'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=6,
+                            help='Рецептов на одной «странице»')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Повторов страницы при замере')
+
+    def measure(self, build, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            build()
+        return (time.perf_counter() - started) / repeat * 1000
+
+    def handle(self, *args, **options):
+        if not Recipe.objects.exists():
+            raise CommandError('Нет рецептов для замера')
+        limit = options['recipes']
+        user = User.objects.filter(
+            recipes__isnull=False,
+        ).first() or AnonymousUser()
+        full_ms = self.measure(
+            lambda: render(RecipeReadSerializer(
+                Recipe.objects.for_read(user)[:limit], many=True,
+            ).data),
+            options['repeat'],
+        )
+        fast_ms = self.measure(
+            lambda: render(RecipeValuesSerializer(
+                RecipeValuesSerializer.project(
+                    Recipe.objects.with_author_subscription(user),
+                )[:limit],
+                many=True,
+            ).data),
+            options['repeat'],
+        )
+        self.stdout.write(
+            f'RecipeReadSerializer: {full_ms:.2f} мс на страницу\n'
+            f'RecipeValuesSerializer: {fast_ms:.2f} мс на страницу '
+            f'(x{full_ms / fast_ms if fast_ms else 0:.1f})'
+        )
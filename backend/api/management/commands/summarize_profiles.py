@@ -0,0 +1,84 @@
+import glob
+import io
+import json
+import os
+import pstats
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def normalize_sql(sql):
+    """Запрос без литералов, чтобы группировать одинаковые по форме."""
+    return ' '.join(LITERALS.sub('?', sql).split())
+
+
+class Command(BaseCommand):
+    help = 'Сводка по медленным запросам из каталога профилировщика'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--spool-dir',
+            default=settings.REQUEST_PROFILER_SPOOL_DIR,
+            help='Каталог с дампами профилировщика',
+        )
+        parser.add_argument('--view', help='Показать только это view')
+        parser.add_argument(
+            '--top', type=int, default=5,
+            help='Количество SQL-запросов и функций в отчёте по view',
+        )
+
+    def handle(self, *args, **options):
+        records = defaultdict(list)
+        for path in sorted(glob.glob(
+            os.path.join(options['spool_dir'], '*.json')
+        )):
+            with open(path, encoding='utf-8') as file:
+                record = json.load(file)
+            record['prof'] = f'{os.path.splitext(path)[0]}.prof'
+            if options['view'] in (None, record['view']):
+                records[record['view']].append(record)
+        if not records:
+            self.stdout.write('Дампов не найдено')
+            return
+
+        ordered = sorted(
+            records.items(),
+            key=lambda item: sum(row['total_ms'] for row in item[1]),
+            reverse=True,
+        )
+        for view, rows in ordered:
+            count = len(rows)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{view}: {count} запросов, '
+                f'среднее {sum(r["total_ms"] for r in rows) / count:.0f} мс, '
+                f'максимум {max(r["total_ms"] for r in rows):.0f} мс, '
+                f'SQL {sum(r["sql_ms"] for r in rows) / count:.0f} мс '
+                f'({sum(len(r["queries"]) for r in rows) / count:.1f} шт.), '
+                f'сериализация '
+                f'{sum(r["serializer_ms"] for r in rows) / count:.0f} мс'
+            ))
+            statements = defaultdict(lambda: [0, 0.0])
+            for row in rows:
+                for query in row['queries']:
+                    stats = statements[normalize_sql(query['sql'])]
+                    stats[0] += 1
+                    stats[1] += query['time']
+            top = sorted(
+                statements.items(), key=lambda item: item[1][1], reverse=True,
+            )[:options['top']]
+            for sql, (calls, total) in top:
+                self.stdout.write(
+                    f'  {total:8.1f} мс {calls:5} раз  {sql[:150]}'
+                )
+            profiles = [row['prof'] for row in rows
+                        if os.path.exists(row['prof'])]
+            if profiles:
+                stream = io.StringIO()
+                stats = pstats.Stats(*profiles, stream=stream)
+                stats.sort_stats('cumulative').print_stats(options['top'])
+                self.stdout.write(stream.getvalue())
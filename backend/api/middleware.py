@@ -0,0 +1,153 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+current_profile = ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    """Замеры одного запроса: SQL, сериализация и общее время."""
+
+    def __init__(self):
+        self.queries = []
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'time': (time.perf_counter() - started) * 1000,
+                'many': many,
+            })
+
+    @property
+    def sql_time(self):
+        return sum(query['time'] for query in self.queries)
+
+
+def _timed_data(prop):
+    """Обёртка свойства data сериализатора с замером времени
+    верхнеуровневой сериализации."""
+
+    def data(self):
+        profile = current_profile.get()
+        if profile is None:
+            return prop.fget(self)
+        profile.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return prop.fget(self)
+        finally:
+            profile.serializer_depth -= 1
+            if not profile.serializer_depth:
+                profile.serializer_time += (
+                    (time.perf_counter() - started) * 1000
+                )
+
+    return property(data)
+
+
+def _instrument_serializers():
+    """Замер BaseSerializer.data: через него проходят и Serializer с
+    ListSerializer, и сериализаторы на основе BaseSerializer."""
+    cls = serializers.BaseSerializer
+    if not getattr(cls.data.fget, '_profiled', False):
+        cls.data = _timed_data(cls.data)
+        cls.data.fget._profiled = True
+
+
+class RequestProfilerMiddleware:
+    """Выборочное профилирование запросов.
+
+    Для отобранных запросов собирает SQL с длительностями, время
+    сериализации и общее время, добавляет заголовок Server-Timing, а для
+    запросов медленнее порога сохраняет дамп cProfile и журнал SQL в
+    каталог REQUEST_PROFILER_SPOOL_DIR.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILER_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_PROFILER_SAMPLE_RATE
+        self.threshold = settings.REQUEST_PROFILER_THRESHOLD_MS
+        self.spool_dir = settings.REQUEST_PROFILER_SPOOL_DIR
+        os.makedirs(self.spool_dir, exist_ok=True)
+        _instrument_serializers()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            with connections['default'].execute_wrapper(profile):
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+        finally:
+            current_profile.reset(token)
+        total = (time.perf_counter() - started) * 1000
+
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={profile.sql_time:.2f};'
+            f'desc="{len(profile.queries)} queries"',
+            f'serializer;dur={profile.serializer_time:.2f}',
+            f'total;dur={total:.2f}',
+        ))
+        if total >= self.threshold:
+            self.dump(request, response, profile, profiler, total)
+        return response
+
+    def dump(self, request, response, profile, profiler, total):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        name = '{}_{}_{:.0f}ms'.format(
+            datetime.now().strftime('%Y%m%d-%H%M%S-%f'),
+            view.replace(':', '.').replace('/', '_'),
+            total,
+        )
+        path = os.path.join(self.spool_dir, name)
+        profiler.dump_stats(f'{path}.prof')
+        with open(f'{path}.json', 'w', encoding='utf-8') as file:
+            json.dump(
+                {
+                    'view': view,
+                    'method': request.method,
+                    'path': request.get_full_path(),
+                    'status': response.status_code,
+                    'total_ms': round(total, 2),
+                    'sql_ms': round(profile.sql_time, 2),
+                    'serializer_ms': round(profile.serializer_time, 2),
+                    'queries': profile.queries,
+                },
+                file,
+                ensure_ascii=False,
+                indent=2,
+            )
+        logger.warning(
+            'Медленный запрос %s %s: %.0f мс, SQL-запросов %d',
+            request.method, request.get_full_path(), total,
+            len(profile.queries),
+        )
@@ -1,11 +1,82 @@
-from rest_framework.pagination import PageNumberPagination
+from datetime import datetime
+
+from recipes.timelines import feed_page
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная пагинация рецептов без подсчёта общего количества."""
+
+    ordering = ('-pub_date', '-id')
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 6
+
+
+class FeedCursorPagination(RecipeCursorPagination):
+    """Курсорная пагинация ленты подписок только вперёд.
+
+    Позиция курсора — (pub_date, id) последнего рецепта страницы, и
+    следующая страница выбирается из ленты по индексу без смещения.
+    """
+
+    def paginate_feed(self, request):
+        """Идентификаторы рецептов страницы в порядке ленты."""
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        position = None
+        if cursor is not None:
+            try:
+                pub_date, recipe_id = cursor.position.rsplit('_', 1)
+                position = (datetime.fromisoformat(pub_date), int(recipe_id))
+            except (AttributeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        rows = feed_page(request.user, self.page_size + 1, position)
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = rows[-1] if self.has_next else None
+        return [recipe_id for _, recipe_id in rows]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        pub_date, recipe_id = self.next_position
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False,
+            position=f'{pub_date.isoformat()}_{recipe_id}',
+        ))
+
+    def get_previous_link(self):
+        return None
 
 
 class RecipePagination(PageNumberPagination):
-    """Пагинация рецептов."""
+    """Пагинация рецептов.
+
+    При наличии параметра cursor (в том числе пустого) используется
+    курсорная пагинация по (-pub_date, -id).
+    """
 
     page_size_query_param = 'limit'
     max_page_size = 6
+    cursor_query_param = 'cursor'
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = RecipeCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view,
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
 
 
 class UserPagination(PageNumberPagination):
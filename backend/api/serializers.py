@@ -1,7 +1,15 @@
+from collections import defaultdict
+
+from api.cache import (get_recipe_fragments, recipe_fragment_keys,
+                       set_recipe_fragments)
+from api.exports import bump_cart_versions
 from django.contrib.auth import get_user_model
 from django.db.transaction import atomic
 from drf_extra_fields.fields import Base64ImageField
+from recipes.batching import on_commit_once
+from recipes.images import is_current_variant
 from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.similar import mark_outdated
 from rest_framework import serializers
 
 User = get_user_model()
@@ -40,6 +48,20 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class IngredientAmountWriteSerializer(serializers.ModelSerializer):
+    """Сериализатор ингредиента с количеством на запись.
+
+    Идентификатор ингредиента проверяется в RecipeWriteSerializer одним
+    запросом на весь рецепт.
+    """
+
+    id = serializers.IntegerField()
+
+    class Meta:
+        model = RecipeIngredient
+        fields = ('id', 'amount')
+
+
 class RecipeMiniSerializer(serializers.ModelSerializer):
     """Базовый сериализатор рецепта."""
 
@@ -55,17 +77,21 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.SerializerMethodField()
+    avatar_thumb = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = (
             'id', 'email', 'username',
             'first_name', 'last_name',
-            'avatar', 'is_subscribed',
+            'avatar', 'avatar_thumb', 'is_subscribed',
+            'recipes_count', 'followers_count',
         )
         read_only_fields = fields
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         return (
             request
@@ -76,6 +102,11 @@ class UserProfileSerializer(serializers.ModelSerializer):
     def get_avatar(self, obj):
         return obj.avatar.url if obj.avatar else None
 
+    def get_avatar_thumb(self, obj):
+        if is_current_variant(obj.avatar.name, obj.avatar_thumb.name):
+            return obj.avatar_thumb.url
+        return self.get_avatar(obj)
+
 
 class RecipeReadSerializer(serializers.ModelSerializer):
     """Сериализатор рецепта на чтение."""
@@ -87,6 +118,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.BooleanField(read_only=True,
                                                    default=False)
     image = serializers.SerializerMethodField()
+    image_thumb = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -99,26 +131,179 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_thumb',
             'text',
             'cooking_time',
+            'favorites_count',
         )
 
     def get_image(self, obj):
         return obj.image.url if obj.image else None
 
+    def get_image_thumb(self, obj):
+        if is_current_variant(obj.image.name, obj.image_thumb.name):
+            return obj.image_thumb.url
+        return self.get_image(obj)
+
+    def to_representation(self, instance):
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        return super().to_representation(instance)
+
+
+class RecipeValuesListSerializer(serializers.ListSerializer):
+    """Список рецептов из values() со связями, загруженными пачкой."""
+
+    def to_representation(self, data):
+        return self.child.represent_rows(list(data))
+
+
+class RecipeValuesSerializer(serializers.BaseSerializer):
+    """Быстрый сериализатор рецепта на чтение.
+
+    Работает со словарями из values() вместо моделей и вложенных
+    сериализаторов: теги и ингредиенты всей страницы загружаются двумя
+    запросами, и только для рецептов, которых нет в кеше фрагментов.
+    Результат совпадает с RecipeReadSerializer.
+    """
+
+    values_fields = (
+        'id', 'name', 'image', 'image_thumb', 'text', 'cooking_time',
+        'pub_date', 'favorites_count', 'is_favorited',
+        'is_in_shopping_cart', 'is_author_subscribed',
+        'author_id', 'author__email', 'author__username',
+        'author__first_name', 'author__last_name', 'author__avatar',
+        'author__avatar_thumb', 'author__recipes_count',
+        'author__followers_count',
+    )
+
+    class Meta:
+        list_serializer_class = RecipeValuesListSerializer
+
+    @classmethod
+    def project(cls, queryset):
+        return queryset.values(*cls.values_fields)
+
+    def to_representation(self, instance):
+        return self.represent_rows([instance])[0]
+
+    def load_tags(self, recipe_ids):
+        tags = defaultdict(list)
+        for row in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).order_by('tag__name').values(
+            'recipe_id', 'tag_id', 'tag__name', 'tag__slug',
+        ):
+            tags[row['recipe_id']].append({
+                'id': row['tag_id'],
+                'name': row['tag__name'],
+                'slug': row['tag__slug'],
+            })
+        return tags
+
+    def load_ingredients(self, recipe_ids):
+        ingredients = defaultdict(list)
+        for row in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).order_by('id').values(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount',
+        ):
+            ingredients[row['recipe_id']].append({
+                'id': row['ingredient_id'],
+                'name': row['ingredient__name'],
+                'measurement_unit': row['ingredient__measurement_unit'],
+                'amount': row['amount'],
+            })
+        return ingredients
+
+    def render_fragments(self, rows):
+        """Независимые от пользователя части ответа по рецептам."""
+        recipe_ids = [row['id'] for row in rows]
+        tags = self.load_tags(recipe_ids)
+        ingredients = self.load_ingredients(recipe_ids)
+        image_url = Recipe._meta.get_field('image').storage.url
+        avatar_url = User._meta.get_field('avatar').storage.url
+        fragments = {}
+        for row in rows:
+            avatar = (
+                avatar_url(row['author__avatar'])
+                if row['author__avatar'] else None
+            )
+            image = image_url(row['image']) if row['image'] else None
+            fragments[row['id']] = {
+                'id': row['id'],
+                'tags': tags[row['id']],
+                'author': {
+                    'id': row['author_id'],
+                    'email': row['author__email'],
+                    'username': row['author__username'],
+                    'first_name': row['author__first_name'],
+                    'last_name': row['author__last_name'],
+                    'avatar': avatar,
+                    'avatar_thumb': (
+                        avatar_url(row['author__avatar_thumb'])
+                        if is_current_variant(
+                            row['author__avatar'],
+                            row['author__avatar_thumb'],
+                        ) else avatar
+                    ),
+                    'is_subscribed': False,
+                    'recipes_count': row['author__recipes_count'],
+                    'followers_count': row['author__followers_count'],
+                },
+                'ingredients': ingredients[row['id']],
+                'is_favorited': False,
+                'is_in_shopping_cart': False,
+                'name': row['name'],
+                'image': image,
+                'image_thumb': (
+                    image_url(row['image_thumb'])
+                    if is_current_variant(row['image'], row['image_thumb'])
+                    else image
+                ),
+                'text': row['text'],
+                'cooking_time': row['cooking_time'],
+                'favorites_count': row['favorites_count'],
+            }
+        return fragments
+
+    def represent_rows(self, rows):
+        """Ответ по рецептам: общие фрагменты берутся из кеша, флаги
+        текущего пользователя накладываются поверх."""
+        if not rows:
+            return []
+        keys = recipe_fragment_keys(rows)
+        fragments = get_recipe_fragments(keys)
+        missing = [row for row in rows if row['id'] not in fragments]
+        if missing:
+            rendered = self.render_fragments(missing)
+            set_recipe_fragments(keys, rendered)
+            fragments.update(rendered)
+        data = []
+        for row in rows:
+            item = dict(fragments[row['id']])
+            item['author'] = dict(
+                item['author'],
+                is_subscribed=bool(row['is_author_subscribed']),
+            )
+            item['is_favorited'] = bool(row['is_favorited'])
+            item['is_in_shopping_cart'] = bool(row['is_in_shopping_cart'])
+            data.append(item)
+        return data
+
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор рецепта на запись."""
 
-    ingredients = IngredientAmountSerializer(
+    ingredients = IngredientAmountWriteSerializer(
         many=True,
         write_only=True,
         allow_empty=False,
         required=True,
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
         write_only=True,
         allow_empty=False,
         required=True,
@@ -170,6 +355,35 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
         return data
 
+    def resolve_ids(self, model, ids):
+        """Объекты по списку идентификаторов одним запросом.
+
+        Порядок и повторы сохраняются, чтобы проверки в validate видели
+        исходные данные; обо всех несуществующих идентификаторах
+        сообщается одной ошибкой.
+        """
+        objects = model.objects.in_bulk(set(ids))
+        missing = sorted(set(ids) - objects.keys())
+        if missing:
+            raise serializers.ValidationError(
+                'Объекты с id {} не существуют.'.format(
+                    ', '.join(map(str, missing)),
+                )
+            )
+        return [objects[pk] for pk in ids]
+
+    def validate_ingredients(self, value):
+        ingredients = self.resolve_ids(
+            Ingredient, [item['id'] for item in value],
+        )
+        return [
+            {'ingredient': ingredient, 'amount': item['amount']}
+            for ingredient, item in zip(ingredients, value)
+        ]
+
+    def validate_tags(self, value):
+        return self.resolve_ids(Tag, value)
+
     def validate_image(self, value):
         if not value:
             raise serializers.ValidationError(
@@ -177,15 +391,65 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             )
         return value
 
-    def create_ingredients(self, recipe, ingredients_data):
-        RecipeIngredient.objects.bulk_create([
-            RecipeIngredient(
-                recipe=recipe,
-                ingredient=item['ingredient'],
-                amount=item['amount'],
-            )
-            for item in ingredients_data
-        ])
+    def save_ingredients(self, recipe, ingredients_data, current=()):
+        """Приведение ингредиентов рецепта к переданному составу.
+
+        Новый состав сравнивается с текущим: пакетно выполняются только
+        нужные вставки, изменения количества и удаления.
+        """
+        current = {item.ingredient_id: item for item in current}
+        wanted = {item['ingredient'].id: item for item in ingredients_data}
+        kept, changed, created = [], [], []
+        for item in current.values():
+            if item.ingredient_id not in wanted:
+                continue
+            data = wanted[item.ingredient_id]
+            item.ingredient = data['ingredient']
+            if item.amount != data['amount']:
+                item.amount = data['amount']
+                changed.append(item)
+            kept.append(item)
+        for ingredient_id, data in wanted.items():
+            if ingredient_id not in current:
+                created.append(RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=data['ingredient'],
+                    amount=data['amount'],
+                ))
+        removed = current.keys() - wanted.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed,
+            ).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if created:
+            RecipeIngredient.objects.bulk_create(created)
+            # bulk_create не отправляет сигналы, по которым рецепт и
+            # рецепты с общими ингредиентами помечаются для пересчёта
+            # похожих.
+            on_commit_once(mark_outdated, [recipe.pk])
+        if current and (changed or created):
+            # То же для версий корзин, в которых лежит рецепт.
+            on_commit_once(bump_cart_versions, [recipe.pk])
+        return kept + created
+
+    def save_tags(self, recipe, tags, current=()):
+        """Изменение тегов рецепта, только если их набор поменялся."""
+        if {tag.id for tag in tags} != {tag.id for tag in current}:
+            recipe.tags.set(tags)
+        return sorted(tags, key=lambda tag: tag.name)
+
+    def cache_relations(self, recipe, relations):
+        """Заполнение кеша prefetch_related сохранёнными связями, чтобы
+        ответ строился без повторного чтения из базы."""
+        if not hasattr(recipe, '_prefetched_objects_cache'):
+            recipe._prefetched_objects_cache = {}
+        for name, objects in relations.items():
+            queryset = getattr(recipe, name).all()
+            queryset._result_cache = list(objects)
+            queryset._prefetch_done = True
+            recipe._prefetched_objects_cache[name] = queryset
 
     @atomic
     def create(self, validated_data):
@@ -193,24 +457,74 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags')
         user = self.context['request'].user
         recipe = Recipe.objects.create(author=user, **validated_data)
-        recipe.tags.set(tags)
-        self.create_ingredients(recipe, ingredients)
+        self.saved_relations = {
+            'tags': self.save_tags(recipe, tags),
+            'ingredients': self.save_ingredients(recipe, ingredients),
+        }
         return recipe
 
     @atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
         instance = super().update(instance, validated_data)
-        instance.tags.set(tags)
-        instance.recipe_ingredients.clear()
-        self.create_ingredients(instance, ingredients)
+        self.saved_relations = {}
+        if tags is not None:
+            self.saved_relations['tags'] = self.save_tags(
+                instance, tags, instance.tags.all(),
+            )
+        if ingredients is not None:
+            self.saved_relations['ingredients'] = self.save_ingredients(
+                instance, ingredients, instance.ingredients.all(),
+            )
         return instance
 
     def to_representation(self, instance):
+        # UpdateModelMixin сбрасывает кеш prefetch_related после
+        # сохранения, поэтому связи восстанавливаются здесь.
+        self.cache_relations(instance, getattr(self, 'saved_relations', {}))
         return RecipeReadSerializer(instance, context=self.context).data
 
 
+class RecipeCoverageSerializer(RecipeMiniSerializer):
+    """Сериализатор рецепта с долей имеющихся ингредиентов."""
+
+    matched = serializers.IntegerField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+    coverage = serializers.SerializerMethodField()
+
+    class Meta(RecipeMiniSerializer.Meta):
+        fields = RecipeMiniSerializer.Meta.fields + (
+            'matched', 'missing', 'coverage',
+        )
+
+    def get_coverage(self, obj):
+        return round(obj.matched / (obj.matched + obj.missing), 4)
+
+
+class PantrySerializer(serializers.Serializer):
+    """Параметры подбора рецептов по имеющимся ингредиентам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=6)
+    offset = serializers.IntegerField(min_value=0, default=0)
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список рецептов для массового добавления и удаления."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+
+
 class UserMiniSerializer(serializers.ModelSerializer):
     """Базовый сериализатор рецепта."""
 
@@ -241,14 +555,13 @@ class SubscriptionSerializer(UserProfileSerializer):
     """Сериализатор отображения подписок и рецептов автора."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserProfileSerializer.Meta):
         fields = (
             'id', 'email', 'username',
             'first_name', 'last_name',
-            'avatar', 'is_subscribed',
-            'recipes', 'recipes_count',
+            'avatar', 'avatar_thumb', 'is_subscribed',
+            'recipes', 'recipes_count', 'followers_count',
         )
 
     def get_recipes(self, obj):
@@ -258,6 +571,8 @@ class SubscriptionSerializer(UserProfileSerializer):
             if request else None
         )
         queryset = obj.recipes.all()
-        if limit and limit.isdigit():
+        if limit and limit.isdigit() and not hasattr(
+            obj, '_prefetched_objects_cache',
+        ):
             queryset = queryset[:int(limit)]
         return UserMiniSerializer(queryset, many=True).data
@@ -0,0 +1,101 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from recipes.batching import on_commit_once
+from recipes.counters import counters_changed
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Subscription
+
+from api.cache import bump_on_commit, invalidate_tag_slugs
+from api.exports import bump_cart_versions
+
+User = get_user_model()
+
+# Поколения меняются после коммита: до него другие запросы видят старые
+# данные и закешировали бы их под новым поколением.
+
+# Области кеша, в ответы которых входят счётчики.
+COUNTER_SCOPES = {
+    'favorites_count': ('recipes', 'recipe:{}'),
+    'recipes_count': ('recipes', 'users', 'author:{}'),
+    'followers_count': ('recipes', 'users', 'author:{}'),
+}
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes_cache(sender, **kwargs):
+    bump_on_commit('recipes')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_fragment(sender, instance, **kwargs):
+    bump_on_commit(f'recipe:{instance.pk}', f'author:{instance.author_id}')
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver((post_save, post_delete), sender=Favorite)
+def invalidate_recipe_relations_fragment(sender, instance, **kwargs):
+    bump_on_commit(f'recipe:{instance.recipe_id}')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags_fragment(sender, instance, action, reverse,
+                                    **kwargs):
+    if not action.startswith('post_'):
+        return
+    bump_on_commit('fragments' if reverse else f'recipe:{instance.pk}')
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_authors_cache(sender, instance, update_fields=None,
+                             **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_on_commit('recipes', 'users', f'author:{instance.pk}')
+
+
+@receiver((post_save, post_delete), sender=Subscription)
+def invalidate_author_fragment(sender, instance, **kwargs):
+    bump_on_commit(f'author:{instance.author_id}')
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscription)
+def invalidate_user_state(sender, instance, **kwargs):
+    bump_on_commit(f'user:{instance.user_id}')
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def invalidate_cart_export(sender, instance, **kwargs):
+    bump_on_commit(f'cart:{instance.user_id}')
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_cart_exports_of_recipe(sender, instance, **kwargs):
+    on_commit_once(bump_cart_versions, [instance.recipe_id])
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags_cache(sender, **kwargs):
+    invalidate_tag_slugs()
+    transaction.on_commit(invalidate_tag_slugs)
+    bump_on_commit('tags', 'recipes', 'fragments')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients_cache(sender, **kwargs):
+    bump_on_commit('ingredients', 'recipes', 'fragments')
+
+
+@receiver(counters_changed)
+def invalidate_counters(sender, pks, field, **kwargs):
+    bump_on_commit(*{
+        scope.format(pk)
+        for scope in COUNTER_SCOPES.get(field, ())
+        for pk in pks
+    })
@@ -0,0 +1,346 @@
+import base64
+import json
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from api.cache import get_generation
+from api.filters import RecipeFilter
+from api.serializers import RecipeReadSerializer, RecipeValuesSerializer
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase, override_settings
+from PIL import Image
+from recipes.images import variant_name
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag, TimelineEntry)
+from rest_framework import status
+from rest_framework.test import APIClient
+from users.models import Subscription
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+LOCAL_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+
+def image_data():
+    buffer = BytesIO()
+    Image.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue(),
+    ).decode()
+
+
+def render(data):
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CACHES=LOCAL_CACHE)
+class RecipeUpdateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов', password='password12',
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {index}', slug=f'tag-{index}')
+            for index in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'сахар')
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        response = self.client.post('/api/recipes/', {
+            'name': 'Блины',
+            'text': 'Тонкие блины',
+            'cooking_time': 20,
+            'image': image_data(),
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 100}
+                for ingredient in self.ingredients
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.recipe = Recipe.objects.get(pk=response.json()['id'])
+
+    def relations(self, tags=None, ingredients=None):
+        return {
+            'tags': [tag.id for tag in tags or self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 100}
+                for ingredient in ingredients or self.ingredients
+            ],
+        }
+
+    def test_partial_update_requires_relations(self):
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/', {'name': 'Оладьи'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ingredients', response.json())
+        response = self.client.patch(f'/api/recipes/{self.recipe.id}/', {
+            'ingredients': self.relations()['ingredients'],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', response.json())
+
+    def test_partial_update_replaces_given_relations(self):
+        response = self.client.patch(f'/api/recipes/{self.recipe.id}/', {
+            'name': 'Оладьи',
+            **self.relations(tags=self.tags[:1]),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['name'], 'Оладьи')
+        self.assertEqual(
+            [tag['id'] for tag in data['tags']], [self.tags[0].id],
+        )
+        self.assertEqual(
+            {item['id'] for item in data['ingredients']},
+            {ingredient.id for ingredient in self.ingredients},
+        )
+        self.assertEqual(self.recipe.tags.count(), 1)
+        self.assertEqual(self.recipe.ingredients.count(), 2)
+
+    def test_partial_update_rejects_duplicate_tags(self):
+        response = self.client.patch(f'/api/recipes/{self.recipe.id}/', {
+            **self.relations(),
+            'tags': [self.tags[0].id, self.tags[0].id],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', response.json())
+
+    @mock.patch('recipes.signals.schedule_variant')
+    def test_update_bumps_generations_on_commit(self, _):
+        scope = f'recipe:{self.recipe.id}'
+        generation = get_generation(scope)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(f'/api/recipes/{self.recipe.id}/', {
+                'name': 'Оладьи',
+                **self.relations(ingredients=self.ingredients[:1]),
+            }, format='json')
+            self.assertEqual(get_generation(scope), generation)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_generation(scope), generation)
+
+    def test_full_update_requires_relations(self):
+        response = self.client.put(f'/api/recipes/{self.recipe.id}/', {
+            'name': 'Оладьи',
+            'text': 'Пышные оладьи',
+            'cooking_time': 15,
+            'image': image_data(),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ingredients', response.json())
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class RecipeValuesSerializerTests(TestCase):
+    """Быстрый сериализатор списка рецептов отдаёт то же, что и
+    RecipeReadSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{index}@example.com', username=f'user{index}',
+                first_name='Имя', last_name='Фамилия', password='password12',
+            )
+            for index in range(3)
+        ]
+        tags = [
+            Tag.objects.create(name=f'Тег {index}', slug=f'tag-{index}')
+            for index in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'сахар', 'соль', 'масло')
+        ]
+        for index in range(7):
+            recipe = Recipe.objects.create(
+                author=cls.users[index % 2],
+                name=f'Рецепт {index}',
+                text='Описание',
+                cooking_time=index + 1,
+                image=f'recipes/images/recipe{index}.png',
+            )
+            recipe.tags.set(tags[:index % 3 + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1,
+                )
+                for ingredient in ingredients[:index % 4 + 1]
+            )
+            if index % 2:
+                Favorite.objects.create(user=cls.users[2], recipe=recipe)
+            if index % 3:
+                ShoppingCart.objects.create(user=cls.users[2], recipe=recipe)
+        # Текущая миниатюра у одного рецепта, устаревшая — у другого.
+        Recipe.objects.filter(name='Рецепт 0').update(
+            image_thumb=variant_name('recipes/images/recipe0.png'),
+        )
+        Recipe.objects.filter(name='Рецепт 1').update(
+            image_thumb=variant_name('recipes/images/old.png'),
+        )
+        Subscription.objects.create(user=cls.users[2], author=cls.users[0])
+
+    def serialize(self, user):
+        full = RecipeReadSerializer(
+            Recipe.objects.for_read(user), many=True,
+        ).data
+        fast = RecipeValuesSerializer(
+            RecipeValuesSerializer.project(
+                Recipe.objects.with_author_subscription(user),
+            ),
+            many=True,
+        ).data
+        return full, fast
+
+    def test_matches_read_serializer(self):
+        for user in [AnonymousUser()] + self.users:
+            with self.subTest(user=user):
+                full, fast = self.serialize(user)
+                self.assertEqual(len(full), Recipe.objects.count())
+                # Сравнивается JSON целиком, вместе с порядком ключей.
+                self.assertEqual(render(fast), render(full))
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class TagFilterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов', password='password12',
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {index}', slug=f'tag-{index}')
+            for index in range(2)
+        ]
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Блины', text='Описание', cooking_time=5,
+            image='recipes/images/recipe.png',
+        )
+        cls.recipe.tags.set(cls.tags)
+
+    def test_skips_tag_deleted_after_validation(self):
+        self.client.get('/api/recipes/?tags=tag-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[1].delete()
+        queryset = RecipeFilter().filter_tags(
+            Recipe.objects.all(), 'tags', ['tag-0', 'tag-1'],
+        )
+        self.assertEqual(list(queryset), [self.recipe])
+        queryset = RecipeFilter().filter_tags(
+            Recipe.objects.all(), 'tags', ['tag-1'],
+        )
+        self.assertEqual(list(queryset), [])
+
+
+@override_settings(CACHES=LOCAL_CACHE, FEED_POPULAR_FOLLOWERS=2)
+@mock.patch('recipes.signals.schedule_variant')
+class FeedTests(TestCase):
+    """Лента подписок: раскладка по лентам и курсорная пагинация."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.other, cls.author, cls.popular = (
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name='Имя', last_name='Фамилия', password='password12',
+            )
+            for name in ('reader', 'other', 'author', 'popular')
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def subscribe(self, user, author):
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.create(user=user, author=author)
+
+    def publish(self, author, count):
+        recipes = []
+        for index in range(count):
+            with self.captureOnCommitCallbacks(execute=True):
+                recipes.append(Recipe.objects.create(
+                    author=author, name=f'Рецепт {index}', text='Описание',
+                    cooking_time=5, image='recipes/images/recipe.png',
+                ))
+        return recipes
+
+    def feed(self, limit=2):
+        ids, url = [], f'/api/recipes/feed/?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.json()
+            self.assertLessEqual(len(data['results']), limit)
+            ids += [recipe['id'] for recipe in data['results']]
+            url = data['next']
+        return ids
+
+    def expected(self, *authors):
+        return list(Recipe.objects.filter(author__in=authors).order_by(
+            '-pub_date', '-id',
+        ).values_list('pk', flat=True))
+
+    def test_keyset_pages_merge_timeline_and_popular_authors(self, _):
+        self.subscribe(self.reader, self.author)
+        self.subscribe(self.reader, self.popular)
+        self.subscribe(self.other, self.popular)
+        self.publish(self.author, 3)
+        self.publish(self.popular, 3)
+        self.publish(self.other, 2)
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.popular).exists(),
+        )
+        # Рецепты с одинаковой датой упорядочиваются по id.
+        pub_date = Recipe.objects.filter(author=self.author).first().pub_date
+        Recipe.objects.filter(author=self.popular).update(pub_date=pub_date)
+        TimelineEntry.objects.update(pub_date=pub_date)
+        expected = self.expected(self.author, self.popular)
+        self.assertEqual(len(expected), 6)
+        self.assertEqual(self.feed(limit=2), expected)
+        self.assertEqual(self.feed(limit=4), expected)
+
+    def test_invalid_cursor(self, _):
+        response = self.client.get('/api/recipes/feed/?cursor=invalid')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_author_stops_being_popular(self, _):
+        self.subscribe(self.reader, self.popular)
+        self.subscribe(self.other, self.popular)
+        self.publish(self.popular, 3)
+        self.assertEqual(self.feed(), self.expected(self.popular))
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.filter(
+                user=self.other, author=self.popular,
+            ).delete()
+        self.assertEqual(self.feed(), self.expected(self.popular))
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 3,
+        )
@@ -1,19 +1,32 @@
+from io import BytesIO
+
+from api.cache import (AnonymousCacheMixin, ConditionalGetMixin,
+                       bump_on_commit)
+from api.exports import EXPORT_FORMATS, cart_scopes, get_export
 from api.filters import IngredientFilter, RecipeFilter
-from api.pagination import RecipePagination, UserPagination
+from api.pagination import (FeedCursorPagination, RecipePagination,
+                            UserPagination)
 from api.permissions import IsAuthorOrReadOnly
 from api.serializers import (AvatarSerializer, IngredientSerializer,
-                             RecipeMiniSerializer, RecipeReadSerializer,
+                             PantrySerializer, RecipeCoverageSerializer,
+                             RecipeIdsSerializer, RecipeMiniSerializer,
+                             RecipeReadSerializer, RecipeValuesSerializer,
                              RecipeWriteSerializer, SubscriptionSerializer,
                              TagSerializer, UserProfileSerializer)
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Q, Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Subquery
+from django.http import FileResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from recipes import shortlinks
+from recipes.counters import recount_counter
+from recipes.coverage import coverage_index
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            SimilarRecipe, Tag)
+from recipes.search import ingredient_index
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import (AllowAny, IsAuthenticated,
@@ -24,18 +37,26 @@ from users.models import Subscription
 User = get_user_model()
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                 viewsets.ReadOnlyModelViewSet):
     """Вьюсет тегов."""
 
+    cache_scope = 'tags'
+    condition_scopes = ('tags',)
+    condition_per_user = False
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = [AllowAny]
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """Вьюсет ингредиентов."""
 
+    cache_scope = 'ingredients'
+    condition_scopes = ('ingredients',)
+    condition_per_user = False
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
@@ -43,37 +64,70 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        name = self.request.query_params.get('name', None)
-        if name:
-            queryset = queryset.filter(
-                Q(name__istartswith=name) | Q(name__icontains=name)
-            ).order_by('name')
-        return queryset
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get('limit', '')
+        return Response(ingredient_index.search(
+            name,
+            limit=int(limit) if limit.isdigit() else None,
+        ))
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                    viewsets.ModelViewSet):
     """Вьюсет рецептов."""
 
+    cache_scope = 'recipes'
+    condition_scopes = ('recipes',)
+    condition_actions = (
+        'list', 'retrieve', 'feed', 'download_shopping_cart',
+    )
+    read_actions = ('list', 'retrieve', 'feed')
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     pagination_class = RecipePagination
+    values_serializer_class = RecipeValuesSerializer
+
+    def get_condition_scopes(self, request):
+        if self.action == 'download_shopping_cart':
+            return cart_scopes(request.user.pk)
+        return super().get_condition_scopes(request)
+
+    def use_values_serializer(self):
+        """Чтение через values() вместо моделей и вложенных
+        сериализаторов; отключается values_serializer_class = None."""
+        return (
+            self.values_serializer_class is not None
+            and self.action in self.read_actions
+        )
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.use_values_serializer():
+            return self.values_serializer_class
+        if self.action in self.read_actions:
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
     def get_queryset(self):
-        return Recipe.objects.with_user_annotations(self.request.user)
+        user = self.request.user
+        if self.use_values_serializer():
+            return self.values_serializer_class.project(
+                Recipe.objects.with_author_subscription(user),
+            )
+        return Recipe.objects.for_read(user)
 
     def _add_to_model(self, request, pk, model):
         user = request.user
         recipe = get_object_or_404(Recipe, pk=pk)
-        obj, created = model.objects.get_or_create(user=user, recipe=recipe)
+        with transaction.atomic():
+            self._lock_relations(user)
+            obj, created = model.objects.get_or_create(
+                user=user, recipe=recipe,
+            )
 
         if not created:
             return Response(
@@ -87,8 +141,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def _remove_from_model(self, request, pk, model):
         user = request.user
         recipe = get_object_or_404(Recipe, pk=pk)
-        deleted_count, _ = model.objects.filter(user=user,
-                                                recipe=recipe).delete()
+        with transaction.atomic():
+            self._lock_relations(user)
+            deleted_count, _ = model.objects.filter(
+                user=user, recipe=recipe,
+            ).delete()
 
         if deleted_count == 0:
             return Response(
@@ -97,12 +154,156 @@ class RecipeViewSet(viewsets.ModelViewSet):
             )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def _lock_relations(self, user):
+        """Блокировка строки пользователя до конца транзакции.
+
+        Избранное и корзину пользователя меняют только его запросы, и
+        под блокировкой они выполняются по очереди, поэтому прочитанные
+        до вставки или удаления связи не устаревают.
+        """
+        list(User.objects.select_for_update().filter(
+            pk=user.pk,
+        ).values_list('pk', flat=True))
+
+    def _invalidate_relations(self, user, model, recipe_ids):
+        """Сброс кеша после массовых операций, которые обходят сигналы."""
+        scopes = [f'user:{user.pk}']
+        if model is Favorite:
+            scopes += [f'recipe:{pk}' for pk in recipe_ids]
+        if model is ShoppingCart:
+            scopes.append(f'cart:{user.pk}')
+        bump_on_commit(*scopes)
+
+    def _bulk_recipe_ids(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['recipes']))
+
+    def _bulk_add_to_model(self, request, model, counter):
+        recipe_ids = self._bulk_recipe_ids(request)
+        user = request.user
+        found = set(Recipe.objects.filter(
+            pk__in=recipe_ids,
+        ).values_list('pk', flat=True))
+        with transaction.atomic():
+            self._lock_relations(user)
+            present = set(model.objects.filter(
+                user=user, recipe_id__in=found,
+            ).values_list('recipe_id', flat=True))
+            added = [pk for pk in recipe_ids if pk in found - present]
+            if added:
+                model.objects.bulk_create(
+                    [model(user=user, recipe_id=pk) for pk in added],
+                    ignore_conflicts=True,
+                )
+                recount_counter(Recipe, counter, added)
+                self._invalidate_relations(user, model, added)
+        return Response({'results': [
+            {
+                'id': pk,
+                'status': (
+                    'not_found' if pk not in found
+                    else 'exists' if pk in present
+                    else 'added'
+                ),
+            }
+            for pk in recipe_ids
+        ]})
+
+    def _bulk_remove_from_model(self, request, model, counter,
+                                recipe_ids=None):
+        user = request.user
+        queryset = model.objects.filter(user=user)
+        with transaction.atomic():
+            self._lock_relations(user)
+            if recipe_ids is None:
+                recipe_ids = list(
+                    queryset.values_list('recipe_id', flat=True),
+                )
+                removed = set(recipe_ids)
+            else:
+                removed = set(queryset.filter(
+                    recipe_id__in=recipe_ids,
+                ).values_list('recipe_id', flat=True))
+            if removed:
+                # Удаление одним запросом без сигналов post_delete:
+                # счётчики и кеш обновляются ниже пачкой.
+                removing = queryset.filter(recipe_id__in=removed)
+                removing._raw_delete(removing.db)
+                recount_counter(Recipe, counter, removed)
+                self._invalidate_relations(user, model, removed)
+        return Response({'results': [
+            {'id': pk, 'status': 'removed' if pk in removed else 'missing'}
+            for pk in recipe_ids
+        ]})
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Рецепты авторов из подписок с курсорной пагинацией по ленте."""
+        paginator = FeedCursorPagination()
+        # Страница ленты идёт в том же порядке (-pub_date, -id).
+        page = self.get_queryset().filter(
+            pk__in=paginator.paginate_feed(request),
+        ).order_by('-pub_date', '-id')
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='what_can_i_cook')
+    def what_can_i_cook(self, request):
+        """Рецепты по имеющимся ингредиентам, отсортированные по доле
+        совпадения."""
+        serializer = PantrySerializer(data={
+            **request.query_params.dict(),
+            'ingredients': [
+                value
+                for param in request.query_params.getlist('ingredients')
+                for value in param.split(',') if value
+            ],
+        })
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        count, page = coverage_index.search(
+            params['ingredients'],
+            max_missing=params.get('max_missing'),
+            offset=params['offset'],
+            limit=params['limit'],
+        )
+        recipes = Recipe.objects.in_bulk([pk for pk, _, _ in page])
+        results = []
+        for pk, matched, missing in page:
+            recipe = recipes.get(pk)
+            if recipe is not None:
+                recipe.matched, recipe.missing = matched, missing
+                results.append(recipe)
+        return Response({
+            'count': count,
+            'results': RecipeCoverageSerializer(
+                results, many=True, context={'request': request},
+            ).data,
+        })
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Похожие рецепты из заранее посчитанной таблицы."""
+        recipes = [
+            row.similar for row in SimilarRecipe.objects.filter(
+                recipe_id=pk,
+            ).select_related('similar')
+        ]
+        if not recipes:
+            get_object_or_404(Recipe, pk=pk)
+        serializer = RecipeMiniSerializer(
+            recipes, many=True, context={'request': request},
+        )
+        return Response(serializer.data)
+
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_link(self, request, pk=None):
         recipe = get_object_or_404(Recipe, pk=pk)
         short_url = request.build_absolute_uri(
             reverse('redirect_short_link',
-                    kwargs={'short_code': recipe.short_code})
+                    kwargs={'short_code': shortlinks.encode(recipe.pk)})
         )
         return Response({'short-link': short_url}, status=status.HTTP_200_OK)
 
@@ -115,6 +316,28 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def remove_from_cart(self, request, pk=None):
         return self._remove_from_model(request, pk, ShoppingCart)
 
+    @action(detail=False, methods=['post'], url_path='shopping_cart/bulk',
+            permission_classes=[IsAuthenticated])
+    def bulk_shopping_cart(self, request):
+        return self._bulk_add_to_model(
+            request, ShoppingCart, 'shopping_carts_count',
+        )
+
+    @bulk_shopping_cart.mapping.delete
+    def bulk_remove_from_cart(self, request):
+        return self._bulk_remove_from_model(
+            request, ShoppingCart, 'shopping_carts_count',
+            self._bulk_recipe_ids(request),
+        )
+
+    @action(detail=False, methods=['delete'],
+            url_path='clear_shopping_cart',
+            permission_classes=[IsAuthenticated])
+    def clear_shopping_cart(self, request):
+        return self._bulk_remove_from_model(
+            request, ShoppingCart, 'shopping_carts_count',
+        )
+
     @action(
         detail=False,
         methods=['get'],
@@ -122,26 +345,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        ingredients = (
-            RecipeIngredient.objects
-            .filter(recipe__shoppingcart_set__user=user)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
-            .order_by('ingredient__name')
-        )
-        lines = [
-            f"{item['ingredient__name']} "
-            f"({item['ingredient__measurement_unit']}) — "
-            f"{item['total_amount']}"
-            for item in ingredients
-        ]
-        content = '\n'.join(lines)
-        response = HttpResponse(content, content_type='text/plain')
-        response['Content-Disposition'] = (
-            'attachment; filename="shopping_cart.txt"'
+        export_format = request.query_params.get('type', 'txt')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'type': f'Доступные форматы: {", ".join(EXPORT_FORMATS)}.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        content = get_export(request.user.pk, export_format)
+        if content is None:
+            return Response(
+                {'detail': 'Список покупок готовится, повторите запрос.'},
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Retry-After': '1'},
+            )
+        return FileResponse(
+            BytesIO(content),
+            as_attachment=True,
+            filename=f'shopping_cart.{export_format}',
+            content_type=EXPORT_FORMATS[export_format].content_type,
         )
-        return response
 
     @action(detail=True, methods=['post'],
             permission_classes=[IsAuthenticated])
@@ -152,10 +374,24 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def remove_from_favorite(self, request, pk=None):
         return self._remove_from_model(request, pk, Favorite)
 
+    @action(detail=False, methods=['post'], url_path='favorite/bulk',
+            permission_classes=[IsAuthenticated])
+    def bulk_favorite(self, request):
+        return self._bulk_add_to_model(request, Favorite, 'favorites_count')
+
+    @bulk_favorite.mapping.delete
+    def bulk_remove_from_favorite(self, request):
+        return self._bulk_remove_from_model(
+            request, Favorite, 'favorites_count',
+            self._bulk_recipe_ids(request),
+        )
 
-class UserViewSet(DjoserUserViewSet):
+
+class UserViewSet(ConditionalGetMixin, DjoserUserViewSet):
     """Вьюсет пользователей на основе Djoser."""
 
+    condition_scopes = ('users', 'recipes')
+    condition_actions = ('list', 'retrieve', 'me', 'subscriptions')
     pagination_class = UserPagination
     permission_classes = [AllowAny]
 
@@ -198,6 +434,27 @@ class UserViewSet(DjoserUserViewSet):
         user.avatar.delete(save=True)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def get_authors_queryset(self):
+        """Авторы с признаком подписки и превью рецептов.
+
+        Превью всех авторов страницы выбираются одним запросом: по каждому
+        автору берутся последние recipes_limit рецептов.
+        """
+        limit = self.request.query_params.get('recipes_limit', '')
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        if limit.isdigit():
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author'),
+                ).order_by('-pub_date', '-id').values('pk')[:int(limit)]
+            ))
+        return User.objects.annotate(
+            is_subscribed=Exists(Subscription.objects.filter(
+                user=self.request.user,
+                author=OuterRef('pk'),
+            )),
+        ).prefetch_related(Prefetch('recipes', queryset=recipes))
+
     @action(
         detail=False,
         methods=['get'],
@@ -206,10 +463,8 @@ class UserViewSet(DjoserUserViewSet):
         serializer_class=SubscriptionSerializer,
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(
+        queryset = self.get_authors_queryset().filter(
             subscribers__user=request.user
-        ).annotate(
-            recipes_count=Count('recipes')
         ).order_by('username')
 
         page = self.paginate_queryset(queryset)
@@ -228,10 +483,7 @@ class UserViewSet(DjoserUserViewSet):
     )
     def subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(
-            User.objects.annotate(recipes_count=Count('recipes')),
-            id=id,
-        )
+        author = get_object_or_404(User, id=id)
 
         if author == user:
             return Response(
@@ -250,7 +502,7 @@ class UserViewSet(DjoserUserViewSet):
             )
 
         serializer = self.get_serializer(
-            author,
+            self.get_authors_queryset().get(pk=author.pk),
             context={'request': request},
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -275,5 +527,4 @@ class UserViewSet(DjoserUserViewSet):
 
 def redirect_short_link(request, short_code):
     """Перенаправление по короткой ссылке на рецепт."""
-    recipe = Recipe.objects.filter(short_code=short_code).first()
-    return redirect(f'/recipes/{recipe.pk}/') if recipe else redirect('/404/')
+    return redirect(shortlinks.redirect_url(short_code))
@@ -31,6 +31,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'recipes.middleware.ShortLinkMiddleware',
+    'api.middleware.RequestProfilerMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -81,6 +83,39 @@ else:
         }
     }
 
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django_redis.cache.RedisCache',
+}
+
+# Поколения кеша из api.cache должны быть общими для всех процессов
+# (воркеров gunicorn и management-команд), поэтому по умолчанию
+# используется файловый кеш, а не память процесса.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'file').lower()
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKEND),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            {
+                'file': str(BASE_DIR / 'cache'),
+                'redis': 'redis://127.0.0.1:6379/1',
+            }.get(CACHE_BACKEND, 'foodgram'),
+        ),
+    }
+}
+if CACHE_BACKEND in ('locmem', 'file'):
+    # По умолчанию эти бэкенды хранят лишь 300 записей и вытесняют
+    # треть из них при переполнении.
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+    }
+
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', 600))
+RECIPE_FRAGMENT_TIMEOUT = int(os.getenv('RECIPE_FRAGMENT_TIMEOUT', 86400))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -118,6 +153,41 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+COVERAGE_INDEX_TTL = int(os.getenv('COVERAGE_INDEX_TTL', 300))
+
+RECIPE_THUMB_SIZE = (600, 600)
+AVATAR_THUMB_SIZE = (128, 128)
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+
+REQUEST_PROFILER_ENABLED = os.getenv(
+    'REQUEST_PROFILER', 'false',
+).lower() in ('1', 'true', 'yes')
+REQUEST_PROFILER_SAMPLE_RATE = float(
+    os.getenv('REQUEST_PROFILER_SAMPLE_RATE', 0.1)
+)
+REQUEST_PROFILER_THRESHOLD_MS = float(
+    os.getenv('REQUEST_PROFILER_THRESHOLD_MS', 500)
+)
+REQUEST_PROFILER_SPOOL_DIR = os.getenv(
+    'REQUEST_PROFILER_SPOOL_DIR', str(BASE_DIR / 'profiles'),
+)
+
+FEED_POPULAR_FOLLOWERS = int(os.getenv('FEED_POPULAR_FOLLOWERS', 1000))
+FEED_BATCH_SIZE = 1000
+
+SHOPPING_LIST_EXPORT_WORKERS = int(
+    os.getenv('SHOPPING_LIST_EXPORT_WORKERS', 2)
+)
+SHOPPING_LIST_EXPORT_WAIT = float(os.getenv('SHOPPING_LIST_EXPORT_WAIT', 5))
+SHOPPING_LIST_EXPORT_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_EXPORT_TIMEOUT', 86400)
+)
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
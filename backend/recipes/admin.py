@@ -31,16 +31,13 @@ class RecipeAdmin(admin.ModelAdmin):
         'name',
         'author',
         'cooking_time',
-        'favorite_count',
+        'favorites_count',
+        'shopping_carts_count',
     )
     search_fields = ('name', 'author__username', 'tags__name')
     list_filter = ('tags',)
     inlines = [RecipeIngredientInline]
-
-    @admin.display(description='Добавлений в избранное')
-    def favorite_count(self, obj):
-        """Возвращает количество добавлений рецепта в избранное."""
-        return obj.favorited_by.count()
+    list_select_related = ('author',)
 
 
 @admin.register(Favorite)
@@ -0,0 +1,42 @@
+from django.db import transaction
+
+
+class _Pending:
+    """Отложенный вызов handler с накопленными идентификаторами.
+
+    Объект лежит в очереди on_commit самого соединения, поэтому при
+    откате транзакции или точки сохранения Django отбрасывает его
+    вместе с идентификаторами.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.ids = set()
+
+    def __call__(self):
+        self.handler(sorted(self.ids))
+
+
+def on_commit_once(handler, ids, using=None):
+    """Вызов handler(ids) после коммита текущей транзакции.
+
+    Сигналы приходят на каждую строку, поэтому идентификаторы,
+    накопленные в одной точке сохранения транзакции, передаются в
+    handler одним вызовом без повторов.
+    """
+    ids = set(ids)
+    if not ids:
+        return
+    connection = transaction.get_connection(using)
+    if connection.in_atomic_block:
+        savepoint_ids = set(connection.savepoint_ids)
+        for sids, func, *_ in connection.run_on_commit:
+            if (
+                isinstance(func, _Pending) and func.handler == handler
+                and sids == savepoint_ids
+            ):
+                func.ids.update(ids)
+                return
+    pending = _Pending(handler)
+    pending.ids.update(ids)
+    transaction.on_commit(pending, using)
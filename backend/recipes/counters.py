@@ -0,0 +1,79 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.dispatch import Signal
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+User = get_user_model()
+
+# Отправляется после изменения счётчика field у записей pks модели sender.
+counters_changed = Signal()
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарное изменение счётчика field у записи pk."""
+    change_counters(model, [pk], field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    """Изменение счётчика field сразу у нескольких записей одним
+    запросом."""
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, 0)},
+    )
+    counters_changed.send(sender=model, pks=list(pks), field=field)
+
+
+def count_subquery(related_model, related_field):
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')},
+            ).order_by().values(related_field).annotate(
+                total=Count('pk'),
+            ).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def recount_counters():
+    """Пересчёт всех счётчиков по фактическим данным.
+
+    Возвращает число исправленных записей для каждого счётчика.
+    """
+    fixed = {}
+    for model, field, related_model, related_field in COUNTERS:
+        actual = count_subquery(related_model, related_field)
+        fixed[f'{model._meta.model_name}.{field}'] = model.objects.annotate(
+            actual=actual,
+        ).exclude(**{field: F('actual')}).update(**{field: actual})
+    return fixed
+
+
+def recount_counter(model, field, pks):
+    """Пересчёт счётчика field у записей pks по фактическим данным.
+
+    Нужен после вставок с ignore_conflicts: строки, которые успел
+    вставить параллельный запрос, пропускаются, и число добавленных
+    строк заранее неизвестно.
+    """
+    related_model, related_field = next(
+        (related_model, related_field)
+        for counter_model, counter_field, related_model, related_field
+        in COUNTERS
+        if counter_model is model and counter_field == field
+    )
+    model.objects.filter(pk__in=pks).update(
+        **{field: count_subquery(related_model, related_field)},
+    )
+    counters_changed.send(sender=model, pks=list(pks), field=field)
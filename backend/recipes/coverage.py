@@ -0,0 +1,148 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from recipes.indexes import MemoryIndex
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+class CoverageIndex(MemoryIndex):
+    """Обратный индекс ингредиент → рецепты в памяти процесса.
+
+    Рецепты каждого ингредиента хранятся битовой маской, где номер бита
+    равен id рецепта; рецепты с одинаковым числом ингредиентов собраны в
+    маски по размеру. Число совпавших ингредиентов по всем рецептам
+    сразу считается побитовым сложением масок, поэтому стоимость поиска
+    зависит от числа ингредиентов в запросе, а не от числа рецептов.
+    """
+
+    ttl_setting = 'COVERAGE_INDEX_TTL'
+
+    def _build(self):
+        from recipes.models import RecipeIngredient
+
+        recipes = defaultdict(set)
+        postings = defaultdict(int)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id',
+        ).iterator():
+            recipes[recipe_id].add(ingredient_id)
+            postings[ingredient_id] |= 1 << recipe_id
+        sizes = defaultdict(int)
+        for recipe_id, ingredients in recipes.items():
+            sizes[len(ingredients)] |= 1 << recipe_id
+        return dict(recipes), dict(postings), dict(sizes)
+
+    def refresh(self, recipe_ids):
+        """Точечное обновление индекса по изменённым рецептам.
+
+        Новое состояние строится на копиях словарей и заменяет старое
+        одним присваиванием, поэтому читатели, получившие состояние до
+        обновления, продолжают работать с неизменными старыми данными.
+        """
+        from recipes.models import RecipeIngredient
+
+        if self._state is None:
+            return
+        current = defaultdict(set)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).values_list('recipe_id', 'ingredient_id'):
+            current[recipe_id].add(ingredient_id)
+        with self._lock:
+            if self._state is None:
+                return
+            recipes, postings, sizes = (
+                dict(mapping) for mapping in self._state
+            )
+            for recipe_id in recipe_ids:
+                bit = 1 << recipe_id
+                old = recipes.pop(recipe_id, set())
+                new = current.get(recipe_id, set())
+                for ingredient_id in old - new:
+                    postings[ingredient_id] &= ~bit
+                    if not postings[ingredient_id]:
+                        del postings[ingredient_id]
+                for ingredient_id in new - old:
+                    postings[ingredient_id] = (
+                        postings.get(ingredient_id, 0) | bit
+                    )
+                if old:
+                    sizes[len(old)] &= ~bit
+                    if not sizes[len(old)]:
+                        del sizes[len(old)]
+                if new:
+                    recipes[recipe_id] = new
+                    sizes[len(new)] = sizes.get(len(new), 0) | bit
+            self._set_state((recipes, postings, sizes))
+
+    def search(self, ingredient_ids, max_missing=None, offset=0, limit=6):
+        """Рецепты по доле имеющихся ингредиентов.
+
+        Сортировка: доля имеющихся ингредиентов, затем число
+        недостающих, затем новизна рецепта. Возвращает общее количество
+        подходящих рецептов и страницу кортежей
+        (id рецепта, совпало, недостаёт).
+        """
+        _, postings, sizes = self._get_state()
+        # Разряды счётчика совпадений: planes[i] — маска рецептов,
+        # у которых в числе совпавших ингредиентов выставлен бит i.
+        planes = []
+        for ingredient_id in set(ingredient_ids):
+            carry = postings.get(ingredient_id, 0)
+            for level, plane in enumerate(planes):
+                if not carry:
+                    break
+                planes[level], carry = plane ^ carry, plane & carry
+            if carry:
+                planes.append(carry)
+        if not planes:
+            return 0, []
+
+        found = reduce(or_, planes)
+        # Одинаковый ключ сортировки бывает только у полностью покрытых
+        # рецептов разного размера, их маски объединяются.
+        groups = defaultdict(list)
+        for matched in range(1, 1 << len(planes)):
+            exact = found
+            for level, plane in enumerate(planes):
+                exact &= plane if matched >> level & 1 else ~plane
+            if not exact:
+                continue
+            for size, size_mask in sizes.items():
+                missing = size - matched
+                if missing < 0 or (
+                    max_missing is not None and missing > max_missing
+                ):
+                    continue
+                group = exact & size_mask
+                if group:
+                    groups[-matched / size, missing].append((matched, group))
+
+        total = 0
+        page = []
+        for (_, missing), parts in sorted(groups.items()):
+            group = reduce(or_, (mask for _, mask in parts))
+            count = popcount(group)
+            total += count
+            if offset >= count:
+                offset -= count
+                continue
+            while group and len(page) < limit:
+                recipe_id = group.bit_length() - 1
+                bit = 1 << recipe_id
+                group ^= bit
+                if offset:
+                    offset -= 1
+                    continue
+                matched = next(
+                    matched for matched, mask in parts if mask & bit
+                )
+                page.append((recipe_id, matched, missing))
+        return total, page
+
+
+coverage_index = CoverageIndex()
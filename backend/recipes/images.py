@@ -0,0 +1,94 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_VARIANT_WORKERS,
+    thread_name_prefix='image-variants',
+)
+
+
+def variant_name(name, suffix='thumb'):
+    """Имя файла варианта картинки в подкаталоге variants."""
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'variants', f'{stem}_{suffix}.webp')
+
+
+def render_thumbnail(field_file, size):
+    """Уменьшенная копия картинки в формате WebP."""
+    field_file.open('rb')
+    try:
+        with Image.open(field_file) as image:
+            image.thumbnail(size)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            buffer = BytesIO()
+            image.save(buffer, 'WEBP', quality=80)
+    finally:
+        field_file.close()
+    return ContentFile(buffer.getvalue())
+
+
+def is_current_variant(original, variant):
+    """Построен ли вариант с именем variant по картинке original.
+
+    Пока новый вариант не создан, в модели остаётся имя варианта
+    прежней картинки, и отдавать его нельзя.
+    """
+    return bool(original) and variant == variant_name(original)
+
+
+def needs_variant(instance, source, target):
+    """Нужно ли (пере)создать вариант target картинки source."""
+    original = getattr(instance, source)
+    if not original:
+        return bool(getattr(instance, target))
+    return getattr(instance, target).name != variant_name(original.name)
+
+
+def generate_variant(model, pk, source, target, size):
+    """Создание варианта картинки и сохранение его имени в модели."""
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not needs_variant(instance, source, target):
+        return
+    original = getattr(instance, source)
+    variant = getattr(instance, target)
+    if not original:
+        variant.delete(save=False)
+    else:
+        name = variant_name(original.name)
+        if variant.name and variant.name != name:
+            # Миниатюра прежней картинки больше не нужна.
+            variant.storage.delete(variant.name)
+        if variant.storage.exists(name):
+            variant.storage.delete(name)
+        variant.name = variant.storage.save(
+            name, render_thumbnail(original, size),
+        )
+    instance.save(update_fields=[target])
+
+
+def _run_in_worker(*args):
+    try:
+        generate_variant(*args)
+    except Exception:
+        logger.exception('Не удалось создать вариант картинки %s', args)
+    finally:
+        close_old_connections()
+
+
+def schedule_variant(instance, source, target, size):
+    """Постановка создания варианта в фоновый пул после коммита."""
+    if not needs_variant(instance, source, target):
+        return
+    args = (type(instance), instance.pk, source, target, size)
+    transaction.on_commit(lambda: executor.submit(_run_in_worker, *args))
@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryIndex:
+    """Основа индексов в памяти процесса с перестройкой по ttl.
+
+    Первое построение выполняет один поток, остальные ждут его под
+    блокировкой. Устаревший индекс продолжает отвечать на запросы, пока
+    новый строится в фоновом потоке; одновременно идёт не больше одной
+    перестройки. Изменения, сделанные invalidate() или точечным
+    обновлением во время перестройки, не затираются её результатом.
+    """
+
+    ttl_setting = None
+
+    def __init__(self, ttl=None):
+        self.ttl = (
+            ttl if ttl is not None
+            else getattr(settings, self.ttl_setting, 300)
+        )
+        self._lock = threading.Lock()
+        self._state = None
+        self._built_at = 0
+        self._version = 0
+        self._rebuilding = False
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+            self._version += 1
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _set_state(self, state):
+        """Замена состояния при точечном обновлении, под self._lock."""
+        self._state = state
+        self._version += 1
+
+    def _expired(self):
+        return self.ttl and time.monotonic() - self._built_at > self.ttl
+
+    def _get_state(self):
+        state = self._state
+        if state is None:
+            with self._lock:
+                if self._state is None:
+                    self._state = self._build()
+                    self._built_at = time.monotonic()
+                return self._state
+        if self._expired():
+            self._schedule_rebuild()
+        return state
+
+    def _schedule_rebuild(self):
+        with self._lock:
+            if self._rebuilding or not self._expired():
+                return
+            self._rebuilding = True
+            version = self._version
+        threading.Thread(
+            target=self._rebuild, args=(version,), daemon=True,
+        ).start()
+
+    def _rebuild(self, version):
+        try:
+            state = self._build()
+            with self._lock:
+                if self._version == version and self._state is not None:
+                    self._state = state
+        except Exception:
+            logger.exception('Не удалось перестроить %s', type(self).__name__)
+        finally:
+            # После ошибки следующая попытка тоже будет не раньше ttl.
+            self._built_at = time.monotonic()
+            self._rebuilding = False
+            connection.close()
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.similar import MAX_DF, METRICS, build
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт похожих рецептов по совпадению ингредиентов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать все рецепты, а не только изменённые',
+        )
+        parser.add_argument('--top', type=int, default=10,
+                            help='Похожих рецептов на один рецепт')
+        parser.add_argument('--metric', choices=METRICS, default='jaccard')
+        parser.add_argument(
+            '--max-df', type=float, default=MAX_DF,
+            help='Ингредиенты, которые встречаются в большей доле '
+                 'рецептов, не используются для поиска кандидатов',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        processed = build(
+            recipe_ids=(
+                Recipe.objects.values_list('pk', flat=True)
+                if options['all'] else None
+            ),
+            top=options['top'],
+            metric=options['metric'],
+            max_df=options['max_df'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {processed} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
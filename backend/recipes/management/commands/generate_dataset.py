@@ -0,0 +1,218 @@
+import random
+import time
+from io import BytesIO
+from itertools import accumulate, islice
+
+from api.cache import bump_generation
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from recipes.counters import recount_counters
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.search import update_recipe_search
+from recipes.timelines import rebuild as rebuild_timelines
+from users.models import Subscription
+
+User = get_user_model()
+
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+)
+PLACEHOLDER_IMAGE = 'recipes/images/placeholder.png'
+PASSWORD = 'load-test-password'
+SEARCH_BATCH_SIZE = 500
+
+
+def skewed_weights(size, exponent):
+    """Накопленные веса распределения Ципфа: первые элементы
+    выбираются заметно чаще остальных."""
+    return list(accumulate(
+        1 / (rank ** exponent) for rank in range(1, size + 1)
+    ))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических данных для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, nargs=2,
+            default=(3, 12), metavar=('MIN', 'MAX'),
+        )
+        parser.add_argument(
+            '--tags-per-recipe', type=int, nargs=2,
+            default=(1, 3), metavar=('MIN', 'MAX'),
+        )
+        parser.add_argument('--favorites', type=int, default=100000)
+        parser.add_argument('--carts', type=int, default=50000)
+        parser.add_argument('--subscriptions', type=int, default=20000)
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярных авторов, '
+                 'рецептов и активных пользователей',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def log(self, message, started):
+        self.stdout.write(f'{message} ({time.monotonic() - started:.1f} с)')
+
+    def bulk_insert(self, model, rows, batch_size):
+        """Пакетная вставка; возвращает идентификаторы новых записей."""
+        last_pk = model.objects.order_by('-pk').values_list(
+            'pk', flat=True,
+        ).first() or 0
+        for batch in batched(rows, batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+        return list(model.objects.filter(pk__gt=last_pk).order_by(
+            'pk',
+        ).values_list('pk', flat=True))
+
+    def placeholder_image(self):
+        if not default_storage.exists(PLACEHOLDER_IMAGE):
+            buffer = BytesIO()
+            Image.new('RGB', (600, 400), (230, 200, 160)).save(buffer, 'PNG')
+            default_storage.save(
+                PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue()),
+            )
+        return PLACEHOLDER_IMAGE
+
+    def pairs(self, count, users, user_weights, targets, target_weights):
+        for _ in range(count):
+            yield (
+                random.choices(users, cum_weights=user_weights)[0],
+                random.choices(targets, cum_weights=target_weights)[0],
+            )
+
+    def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+        batch_size = options['batch_size']
+        skew = options['skew']
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        if not ingredient_ids:
+            raise CommandError(
+                'Каталог ингредиентов пуст, выполните import_ingredients'
+            )
+        started = time.monotonic()
+
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        if not tag_ids:
+            Tag.objects.bulk_create(
+                [Tag(name=name, slug=slug) for name, slug in DEFAULT_TAGS]
+            )
+            tag_ids = list(Tag.objects.values_list('pk', flat=True))
+
+        prefix = f'load{int(time.time())}'
+        password = make_password(PASSWORD)
+        user_ids = self.bulk_insert(User, (
+            User(
+                email=f'{prefix}_{number}@example.com',
+                username=f'{prefix}_{number}',
+                first_name='Пользователь',
+                last_name=str(number),
+                password=password,
+            )
+            for number in range(options['users'])
+        ), batch_size)
+        if not user_ids:
+            raise CommandError('Нужен хотя бы один пользователь')
+        random.shuffle(user_ids)
+        user_weights = skewed_weights(len(user_ids), skew)
+        self.log(f'Пользователей: {len(user_ids)}', started)
+
+        image = self.placeholder_image()
+        recipe_ids = self.bulk_insert(Recipe, (
+            Recipe(
+                author_id=random.choices(
+                    user_ids, cum_weights=user_weights,
+                )[0],
+                name=f'Рецепт {number}',
+                text=f'Описание синтетического рецепта {number}',
+                image=image,
+                cooking_time=random.randint(5, 180),
+            )
+            for number in range(options['recipes'])
+        ), batch_size)
+        self.log(f'Рецептов: {len(recipe_ids)}', started)
+
+        low, high = options['ingredients_per_recipe']
+        self.bulk_insert(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=random.randint(1, 1000),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in random.sample(
+                ingredient_ids,
+                min(random.randint(low, high), len(ingredient_ids)),
+            )
+        ), batch_size)
+        low, high = options['tags_per_recipe']
+        RecipeTag = Recipe.tags.through
+        for batch in batched((
+            RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in random.sample(
+                tag_ids, min(random.randint(low, high), len(tag_ids)),
+            )
+        ), batch_size):
+            RecipeTag.objects.bulk_create(batch, ignore_conflicts=True)
+        self.log('Ингредиенты и теги рецептов созданы', started)
+
+        random.shuffle(recipe_ids)
+        recipe_weights = skewed_weights(len(recipe_ids), skew)
+        for model, option in (
+            (Favorite, 'favorites'), (ShoppingCart, 'carts'),
+        ):
+            created = self.bulk_insert(model, (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id, recipe_id in self.pairs(
+                    options[option], user_ids, user_weights,
+                    recipe_ids, recipe_weights,
+                )
+            ), batch_size)
+            self.log(
+                f'{model._meta.verbose_name_plural}: {len(created)}', started,
+            )
+
+        followers = user_ids[::-1]
+        created = self.bulk_insert(Subscription, (
+            Subscription(user_id=user_id, author_id=author_id)
+            for user_id, author_id in self.pairs(
+                options['subscriptions'], followers, user_weights,
+                user_ids, user_weights,
+            )
+            if user_id != author_id
+        ), batch_size)
+        self.log(f'Подписок: {len(created)}', started)
+
+        recount_counters()
+        self.log(f'Записей в лентах: {rebuild_timelines()}', started)
+        for batch in batched(recipe_ids, SEARCH_BATCH_SIZE):
+            update_recipe_search(batch)
+        bump_generation('recipes', 'users', 'tags', 'fragments')
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.monotonic() - started:.1f} с. '
+            f'Пароль пользователей: {PASSWORD}'
+        ))
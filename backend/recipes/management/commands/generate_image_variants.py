@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from recipes.images import generate_variant, needs_variant
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Создание миниатюр для существующих картинок рецептов и аватаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать миниатюры, даже если они уже есть',
+        )
+
+    def handle(self, *args, **options):
+        targets = (
+            (Recipe, 'image', 'image_thumb', settings.RECIPE_THUMB_SIZE),
+            (User, 'avatar', 'avatar_thumb', settings.AVATAR_THUMB_SIZE),
+        )
+        for model, source, target, size in targets:
+            created = 0
+            queryset = model.objects.exclude(**{source: ''}).exclude(
+                **{f'{source}__isnull': True},
+            ).only('pk', source, target)
+            for instance in queryset.iterator():
+                if options['force']:
+                    model.objects.filter(pk=instance.pk).update(
+                        **{target: ''},
+                    )
+                elif not needs_variant(instance, source, target):
+                    continue
+                try:
+                    generate_variant(model, instance.pk, source, target, size)
+                except (OSError, ValueError) as error:
+                    self.stdout.write(self.style.WARNING(
+                        f'{model._meta.verbose_name} {instance.pk}: {error}'
+                    ))
+                    continue
+                created += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: '
+                f'создано миниатюр — {created}'
+            ))
@@ -1,13 +1,21 @@
 import csv
+import json
 import os
+import time
+from itertools import islice
 
+from api.cache import bump_generation
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from recipes.models import Ingredient
 
+FORMATS = ('csv', 'json', 'jsonl')
+READ_CHUNK_SIZE = 64 * 1024
+
 
 class Command(BaseCommand):
-    help = 'Импорт ингредиентов из data/ingredients.csv'
+    help = 'Импорт ингредиентов из CSV, JSON или JSONL'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -18,9 +26,100 @@ class Command(BaseCommand):
                 'data',
                 'ingredients.csv'
             ),
-            help='Путь до файла ingredients.csv'
+            help='Путь до файла с ингредиентами'
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла (по умолчанию определяется по расширению)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одной транзакции',
         )
 
+    def read_csv(self, file):
+        for row in csv.reader(file):
+            yield (row if len(row) == 2 else None), row
+
+    def read_jsonl(self, file):
+        for line in file:
+            if line.strip():
+                yield self.parse_object(line), line.strip()
+
+    def read_json(self, file):
+        """Потоковое чтение JSON-массива объектов без загрузки
+        всего файла в память."""
+        decoder = json.JSONDecoder()
+        buffer = ''
+        started = False
+        while True:
+            chunk = file.read(READ_CHUNK_SIZE)
+            buffer += chunk
+            position = 0
+            while True:
+                while position < len(buffer) and buffer[position] in (
+                    ' \t\r\n,'
+                ):
+                    position += 1
+                if not started and buffer[position:position + 1] == '[':
+                    started = True
+                    position += 1
+                    continue
+                if buffer[position:position + 1] in (']', ''):
+                    break
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if not chunk:
+                        raise CommandError('Некорректный JSON-файл')
+                    break
+                yield self.parse_object(value), value
+                position = end
+            buffer = buffer[position:]
+            if not chunk:
+                return
+
+    def parse_object(self, value):
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError:
+                return None
+        if not isinstance(value, dict):
+            return None
+        name = value.get('name')
+        measurement_unit = value.get('measurement_unit')
+        if not isinstance(name, str) or not isinstance(measurement_unit, str):
+            return None
+        return name, measurement_unit
+
+    def import_batch(self, batch):
+        """Вставка пачки ингредиентов, которых ещё нет в базе.
+
+        Все поля ингредиента входят в ограничение unique_ingredient,
+        поэтому обновлять у существующих записей нечего: upsert сводится
+        к вставке новых и пропуску существующих строк.
+        """
+        keys = set(batch)
+        with transaction.atomic():
+            existing = set(
+                Ingredient.objects.filter(
+                    name__in={name for name, _ in keys},
+                ).values_list('name', 'measurement_unit')
+            )
+            new = keys - existing
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in new
+                ],
+                ignore_conflicts=True,
+            )
+        return len(new), len(batch) - len(new)
+
     def handle(self, *args, **options):
         path = options['path']
         if not os.path.exists(path):
@@ -28,28 +127,52 @@ class Command(BaseCommand):
                 self.style.ERROR(f'Файл не найден: {path}')
             )
             return
-
-        with open(path, encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            ingredients = []
-            for row in reader:
-                try:
-                    name, measurement_unit = row
-                    ingredients.append(Ingredient(
-                        name=name.strip(),
-                        measurement_unit=measurement_unit.strip()
-                    ))
-                except ValueError:
-                    self.stdout.write(
-                        self.style.WARNING(f'Пропущена строка: {row}')
-                    )
-
-        Ingredient.objects.bulk_create(
-            ingredients,
-            ignore_conflicts=True
+        file_format = (
+            options['format']
+            or os.path.splitext(path)[1].lstrip('.').lower()
         )
+        if file_format not in FORMATS:
+            raise CommandError(
+                f'Неизвестный формат файла: {file_format}. '
+                f'Поддерживаются: {", ".join(FORMATS)}'
+            )
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('Размер пачки должен быть положительным')
+
+        inserted = existing = skipped = 0
+        started = time.monotonic()
+        with open(path, encoding='utf-8') as file:
+            rows = getattr(self, f'read_{file_format}')(file)
+            while True:
+                chunk = list(islice(rows, batch_size))
+                if not chunk:
+                    break
+                batch = []
+                for parsed, raw in chunk:
+                    if parsed is None or not all(
+                        value.strip() for value in parsed
+                    ):
+                        skipped += 1
+                        self.stdout.write(
+                            self.style.WARNING(f'Пропущена строка: {raw}')
+                        )
+                        continue
+                    batch.append(tuple(value.strip() for value in parsed))
+                if batch:
+                    batch_inserted, batch_existing = self.import_batch(batch)
+                    inserted += batch_inserted
+                    existing += batch_existing
+        elapsed = time.monotonic() - started
+
+        if inserted:
+            bump_generation('ingredients', 'recipes', 'fragments')
+        total = inserted + existing + skipped
         self.stdout.write(
             self.style.SUCCESS(
-                f'Импортировано {len(ingredients)} ингредиентов'
+                f'Импортировано {inserted} ингредиентов, '
+                f'уже существовало {existing}, пропущено {skipped}. '
+                f'Обработано {total} строк за {elapsed:.2f} с '
+                f'({total / elapsed if elapsed else total:.0f} строк/с)'
             )
         )
@@ -0,0 +1,14 @@
+from api.cache import bump_generation
+from django.core.management.base import BaseCommand
+from recipes.timelines import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересборка лент подписок по текущим подпискам и рецептам'
+
+    def handle(self, *args, **options):
+        total = rebuild()
+        bump_generation('recipes')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны, записей: {total}'
+        ))
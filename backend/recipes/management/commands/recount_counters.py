@@ -0,0 +1,15 @@
+from api.cache import bump_generation
+from django.core.management.base import BaseCommand
+from recipes.counters import recount_counters
+
+
+class Command(BaseCommand):
+    help = 'Сверка счётчиков избранного, покупок, рецептов и подписчиков'
+
+    def handle(self, *args, **options):
+        result = recount_counters()
+        for counter, fixed in result.items():
+            self.stdout.write(f'{counter}: исправлено записей — {fixed}')
+        if any(result.values()):
+            bump_generation('recipes', 'users', 'fragments')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
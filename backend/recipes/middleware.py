@@ -0,0 +1,34 @@
+import re
+
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from recipes.shortlinks import redirect_url
+
+
+class ShortLinkMiddleware:
+    """Перенаправление по короткой ссылке до остальных middleware.
+
+    Сессии и аутентификация для коротких ссылок не нужны, поэтому ответ
+    формируется сразу, без обращения к базе для новых кодов.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pattern = None
+
+    def get_pattern(self):
+        if self.pattern is None:
+            prefix, _, suffix = reverse(
+                'redirect_short_link',
+                kwargs={'short_code': 'code'},
+            ).rpartition('code')
+            self.pattern = re.compile(
+                f'^{re.escape(prefix)}([^/]+){re.escape(suffix)}$'
+            )
+        return self.pattern
+
+    def __call__(self, request):
+        match = self.get_pattern().match(request.path_info)
+        if match and request.method in ('GET', 'HEAD'):
+            return HttpResponseRedirect(redirect_url(match.group(1)))
+        return self.get_response(request)
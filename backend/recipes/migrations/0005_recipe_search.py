@@ -0,0 +1,75 @@
+from django.db import migrations
+
+FOLD_SQL = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+FOLDED_COLUMNS = {
+    'fold_r_name': FOLD_SQL.format('r.name'),
+    'fold_r_text': FOLD_SQL.format('r.text'),
+    'fold_i_name': FOLD_SQL.format('i.name'),
+}
+
+POSTGRES_FORWARD = [
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    'CREATE INDEX recipes_recipe_search_vector_gin '
+    'ON recipes_recipe USING GIN (search_vector)',
+    """
+    UPDATE recipes_recipe AS r SET search_vector =
+        setweight(to_tsvector('russian', {fold_r_name}), 'A')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg({fold_i_name}, ' ')
+            FROM recipes_recipeingredient ri
+            JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+            WHERE ri.recipe_id = r.id
+        ), '')), 'B')
+        || setweight(to_tsvector('russian', {fold_r_text}), 'C')
+    """.format(**FOLDED_COLUMNS),
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5("
+    "name, text, ingredients, tokenize='unicode61 remove_diacritics 2')",
+    """
+    INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients)
+    SELECT r.id, {fold_r_name}, {fold_r_text}, coalesce((
+        SELECT group_concat({fold_i_name}, ' ')
+        FROM recipes_recipeingredient ri
+        JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+        WHERE ri.recipe_id = r.id
+    ), '')
+    FROM recipes_recipe r
+    """.format(**FOLDED_COLUMNS),
+]
+
+SQLITE_BACKWARD = ['DROP TABLE IF EXISTS recipes_recipe_fts']
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({
+                'postgresql': POSTGRES_FORWARD,
+                'sqlite': SQLITE_FORWARD,
+            }),
+            run_for_vendor({
+                'postgresql': POSTGRES_BACKWARD,
+                'sqlite': SQLITE_BACKWARD,
+            }),
+        ),
+    ]
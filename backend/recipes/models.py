@@ -2,7 +2,8 @@ import shortuuid
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import Exists, OuterRef
+from django.db.models import Exists, OuterRef, Prefetch
+from users.models import Subscription
 
 User = get_user_model()
 
@@ -57,6 +58,32 @@ class RecipeManager(models.Manager):
             is_in_shopping_cart=Exists(cart_subquery),
         )
 
+    def with_author_subscription(self, user):
+        if user.is_authenticated:
+            subscribed = Exists(Subscription.objects.filter(
+                user=user,
+                author=OuterRef('author'),
+            ))
+        else:
+            subscribed = Exists(Subscription.objects.none())
+        return self.with_user_annotations(user).annotate(
+            is_author_subscribed=subscribed,
+        )
+
+    def for_read(self, user):
+        """Рецепты для чтения за фиксированное число запросов."""
+        return self.with_author_subscription(user).select_related(
+            'author',
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient',
+                ).order_by('id'),
+            ),
+        )
+
 
 class Recipe(models.Model):
     """Модель рецепта."""
@@ -78,6 +105,12 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         verbose_name='Картинка',
     )
+    image_thumb = models.ImageField(
+        upload_to='recipes/images/variants/',
+        blank=True,
+        editable=False,
+        verbose_name='Миниатюра картинки',
+    )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления (мин)',
         validators=[
@@ -115,6 +148,22 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное',
+    )
+    shopping_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в список покупок',
+    )
+    similar_updated = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Похожие рецепты пересчитаны',
+    )
     favorited_by = models.ManyToManyField(
         User,
         related_name='favorite_recipes',
@@ -125,6 +174,16 @@ class Recipe(models.Model):
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -242,3 +301,78 @@ class ShoppingCart(UserRecipeRelation):
 
     def __str__(self):
         return f'{self.user} → {self.recipe}'
+
+
+class TimelineEntry(UserRecipeRelation):
+    """Модель записи в ленте подписок пользователя.
+
+    Записи создаются при публикации рецепта для всех подписчиков
+    автора; рецепты популярных авторов в ленту не раскладываются и
+    подмешиваются при чтении. Дата публикации копируется из рецепта,
+    чтобы страница ленты читалась по индексу без обращения к рецептам.
+    """
+
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта',
+    )
+
+    class Meta(UserRecipeRelation.Meta):
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        indexes = [
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx',
+            ),
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_pub_date_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class SimilarRecipe(models.Model):
+    """Модель похожего рецепта по совпадению ингредиентов."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('-score',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similar_recipe_score_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
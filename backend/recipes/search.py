@@ -0,0 +1,189 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from recipes.indexes import MemoryIndex
+
+FOLD_SQL = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+FOLDED_COLUMNS = {
+    'fold_r_name': FOLD_SQL.format('r.name'),
+    'fold_r_text': FOLD_SQL.format('r.text'),
+    'fold_i_name': FOLD_SQL.format('i.name'),
+}
+
+POSTGRES_UPDATE_SQL = """
+    UPDATE recipes_recipe AS r SET search_vector =
+        setweight(to_tsvector('russian', {fold_r_name}), 'A')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg({fold_i_name}, ' ')
+            FROM recipes_recipeingredient ri
+            JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+            WHERE ri.recipe_id = r.id
+        ), '')), 'B')
+        || setweight(to_tsvector('russian', {fold_r_text}), 'C')
+    WHERE r.id = ANY(%s)
+"""
+
+SQLITE_DELETE_SQL = (
+    'DELETE FROM recipes_recipe_fts WHERE rowid IN ({placeholders})'
+)
+
+SQLITE_INSERT_SQL = """
+    INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients)
+    SELECT r.id, {fold_r_name}, {fold_r_text}, coalesce((
+        SELECT group_concat({fold_i_name}, ' ')
+        FROM recipes_recipeingredient ri
+        JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+        WHERE ri.recipe_id = r.id
+    ), '')
+    FROM recipes_recipe r
+    WHERE r.id IN ({placeholders})
+"""
+
+
+def normalize(value):
+    """Приведение строки к виду для поиска: регистр и ё/е."""
+    return value.strip().casefold().replace('ё', 'е')
+
+
+class _TrieNode:
+    """Узел префиксного дерева.
+
+    Записи индекса отсортированы по нормализованному названию, поэтому
+    все записи с общим префиксом занимают непрерывный диапазон
+    [start, end), который и хранит узел.
+    """
+
+    __slots__ = ('children', 'start', 'end')
+
+    def __init__(self, start):
+        self.children = {}
+        self.start = start
+        self.end = start
+
+
+class IngredientIndex(MemoryIndex):
+    """Индекс ингредиентов в памяти процесса для автодополнения."""
+
+    ttl_setting = 'INGREDIENT_INDEX_TTL'
+
+    def _build(self):
+        from recipes.models import Ingredient
+
+        rows = sorted(
+            (
+                (normalize(name), pk, name, unit)
+                for pk, name, unit in Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit',
+                ).iterator()
+            ),
+            key=lambda row: (row[0], row[1]),
+        )
+        keys = [row[0] for row in rows]
+        items = [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, pk, name, unit in rows
+        ]
+        root = _TrieNode(0)
+        root.end = len(keys)
+        for position, key in enumerate(keys):
+            node = root
+            for char in key:
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = _TrieNode(position)
+                child.end = position + 1
+                node = child
+        return root, keys, items
+
+    def search(self, query, limit=None):
+        """Ингредиенты, название которых начинается с query, а следом —
+        содержащие query в середине названия."""
+        root, keys, items = self._get_state()
+        query = normalize(query)
+        node = root
+        for char in query:
+            node = node.children.get(char)
+            if node is None:
+                start = end = 0
+                break
+        else:
+            start, end = node.start, node.end
+        if limit is not None and end - start >= limit:
+            return items[start:start + limit]
+        result = items[start:end]
+        if not query:
+            return result
+        for position, key in enumerate(keys):
+            if limit is not None and len(result) >= limit:
+                break
+            if (position < start or position >= end) and query in key:
+                result.append(items[position])
+        return result
+
+
+ingredient_index = IngredientIndex()
+
+
+def update_recipe_search(recipe_ids):
+    """Обновление поискового индекса для рецептов recipe_ids."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                POSTGRES_UPDATE_SQL.format(**FOLDED_COLUMNS), [recipe_ids],
+            )
+        elif connection.vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(recipe_ids))
+            for sql in (SQLITE_DELETE_SQL, SQLITE_INSERT_SQL):
+                cursor.execute(
+                    sql.format(placeholders=placeholders, **FOLDED_COLUMNS),
+                    recipe_ids,
+                )
+
+
+def search_recipes(queryset, query):
+    """Полнотекстовый поиск рецептов с сортировкой по релевантности.
+
+    Ищутся рецепты, содержащие все слова запроса (с учётом префиксов)
+    в названии, ингредиентах или описании.
+    """
+    words = re.findall(r'[^\W_]+', normalize(query))
+    if not words:
+        return queryset
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{word}:*' for word in words)
+        rank = RawSQL(
+            "ts_rank(recipes_recipe.search_vector, "
+            "to_tsquery('russian', %s))",
+            [tsquery],
+        )
+        matches = RawSQL(
+            "SELECT id FROM recipes_recipe "
+            "WHERE search_vector @@ to_tsquery('russian', %s)",
+            [tsquery],
+        )
+    elif connection.vendor == 'sqlite':
+        match = ' '.join(f'"{word}"*' for word in words)
+        rank = RawSQL(
+            'SELECT -bm25(recipes_recipe_fts, 10.0, 1.0, 5.0) '
+            'FROM recipes_recipe_fts '
+            'WHERE recipes_recipe_fts MATCH %s '
+            'AND recipes_recipe_fts.rowid = recipes_recipe.id',
+            [match],
+        )
+        matches = RawSQL(
+            'SELECT rowid FROM recipes_recipe_fts '
+            'WHERE recipes_recipe_fts MATCH %s',
+            [match],
+        )
+    else:
+        for word in words:
+            queryset = queryset.filter(name__icontains=word)
+        return queryset
+    return queryset.filter(pk__in=matches).annotate(
+        search_rank=rank,
+    ).order_by('-search_rank', '-pub_date', '-id')
@@ -0,0 +1,59 @@
+import string
+import zlib
+from functools import lru_cache
+
+ALPHABET = string.digits + string.ascii_letters
+BASE = len(ALPHABET)
+MAX_CODE_LENGTH = 12
+
+
+def _checksum(digits):
+    return ALPHABET[zlib.crc32(digits.encode()) % BASE]
+
+
+def encode(pk):
+    """Короткий код рецепта: pk в base62 и контрольный символ."""
+    digits = ''
+    while True:
+        pk, remainder = divmod(pk, BASE)
+        digits = ALPHABET[remainder] + digits
+        if not pk:
+            break
+    return digits + _checksum(digits)
+
+
+def decode(code):
+    """pk рецепта по короткому коду или None, если код некорректен."""
+    if not 2 <= len(code) <= MAX_CODE_LENGTH:
+        return None
+    digits, check = code[:-1], code[-1]
+    if any(char not in ALPHABET for char in code):
+        return None
+    if _checksum(digits) != check:
+        return None
+    pk = 0
+    for char in digits:
+        pk = pk * BASE + ALPHABET.index(char)
+    return pk
+
+
+@lru_cache(maxsize=4096)
+def _legacy_lookup(short_code):
+    from recipes.models import Recipe
+
+    return Recipe.objects.filter(
+        short_code=short_code,
+    ).values_list('pk', flat=True).first()
+
+
+def resolve(short_code):
+    """pk рецепта по новому или старому (shortuuid) короткому коду."""
+    pk = decode(short_code)
+    if pk is None:
+        pk = _legacy_lookup(short_code)
+    return pk
+
+
+def redirect_url(short_code):
+    pk = resolve(short_code)
+    return f'/recipes/{pk}/' if pk else '/404/'
@@ -0,0 +1,157 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes import timelines
+from recipes.batching import on_commit_once
+from recipes.counters import change_counter
+from recipes.coverage import coverage_index
+from recipes.images import schedule_variant
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart)
+from recipes.search import ingredient_index, update_recipe_search
+from recipes.similar import mark_ingredients_outdated, mark_outdated
+from users.models import Subscription
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    """Перестроение индекса ингредиентов при их изменении."""
+    ingredient_index.invalidate()
+
+
+def refresh_recipe_indexes(recipe_ids):
+    update_recipe_search(recipe_ids)
+    coverage_index.refresh(recipe_ids)
+
+
+def schedule_search_update(recipe_ids):
+    """Обновление поискового индекса и индекса ингредиент → рецепты
+    после коммита транзакции, когда ингредиенты рецептов уже записаны.
+
+    Рецепты, изменённые за транзакцию, обновляются одним вызовом.
+    """
+    on_commit_once(refresh_recipe_indexes, recipe_ids)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def update_recipe_search_index(sender, instance, **kwargs):
+    schedule_search_update([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def update_recipe_ingredients_search(sender, instance, **kwargs):
+    schedule_search_update([instance.recipe_id])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def outdate_similar_recipes(sender, instance, signal, **kwargs):
+    """Пометка рецепта и рецептов с общими ингредиентами для пересчёта
+    похожих рецептов.
+
+    После коммита у рецепта остаются только новые ингредиенты, поэтому
+    удалённые запоминаются отдельно.
+    """
+    on_commit_once(mark_outdated, [instance.recipe_id])
+    if signal is post_delete:
+        on_commit_once(mark_ingredients_outdated, [instance.ingredient_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search(sender, instance, created, **kwargs):
+    if not created:
+        schedule_search_update(
+            instance.recipe_ingredients.values_list('recipe_id', flat=True),
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_image_variants(sender, instance, **kwargs):
+    """Фоновое создание миниатюры картинки рецепта."""
+    schedule_variant(
+        instance, 'image', 'image_thumb', settings.RECIPE_THUMB_SIZE,
+    )
+
+
+@receiver(post_save, sender=User)
+def create_avatar_variants(sender, instance, **kwargs):
+    """Фоновое создание миниатюры аватара."""
+    schedule_variant(
+        instance, 'avatar', 'avatar_thumb', settings.AVATAR_THUMB_SIZE,
+    )
+
+
+def _counter_delta(signal, created):
+    if signal is post_delete:
+        return -1
+    return 1 if created else 0
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def update_favorites_count(sender, instance, signal, created=False, **kwargs):
+    delta = _counter_delta(signal, created)
+    if delta:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', delta)
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def update_shopping_carts_count(sender, instance, signal, created=False,
+                                **kwargs):
+    delta = _counter_delta(signal, created)
+    if delta:
+        change_counter(
+            Recipe, instance.recipe_id, 'shopping_carts_count', delta,
+        )
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def update_recipes_count(sender, instance, signal, created=False, **kwargs):
+    delta = _counter_delta(signal, created)
+    if delta:
+        change_counter(User, instance.author_id, 'recipes_count', delta)
+
+
+@receiver((post_save, post_delete), sender=Subscription)
+def update_followers_count(sender, instance, signal, created=False,
+                           **kwargs):
+    delta = _counter_delta(signal, created)
+    if delta:
+        change_counter(User, instance.author_id, 'followers_count', delta)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    """Раскладка нового рецепта по лентам подписчиков после коммита."""
+    if created:
+        transaction.on_commit(lambda: timelines.fan_out(instance))
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timelines.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def prune_timeline(sender, instance, **kwargs):
+    timelines.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def fan_out_former_popular(sender, instance, **kwargs):
+    """Раскладка рецептов автора, который перестал быть популярным.
+
+    Счётчик подписчиков к этому моменту уже уменьшен обработчиком
+    update_followers_count, подключённым раньше.
+    """
+    author_id = instance.author_id
+    if User.objects.filter(
+        pk=author_id,
+        followers_count=settings.FEED_POPULAR_FOLLOWERS - 1,
+    ).exists():
+        transaction.on_commit(
+            lambda: timelines.backfill_followers(author_id),
+        )
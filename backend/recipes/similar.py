@@ -0,0 +1,143 @@
+import math
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from recipes.models import Ingredient, Recipe, RecipeIngredient, SimilarRecipe
+
+METRICS = ('jaccard', 'cosine')
+MAX_DF = 0.2
+# Ограничение по доле рецептов имеет смысл только на большом каталоге.
+MIN_MAX_POSTINGS = 100
+
+
+def posting_limit(recipes_count, max_df=MAX_DF):
+    """Наибольшее число рецептов у ингредиента, по которому ещё ищутся
+    кандидаты в похожие."""
+    return max(MIN_MAX_POSTINGS, int(recipes_count * max_df))
+
+
+def rare_ingredients(ingredient_ids):
+    """Ингредиенты из ingredient_ids, по которым build ищет кандидатов.
+
+    Частые ингредиенты (соль, вода) не связывают рецепты в похожие,
+    поэтому их изменение не требует пересчёта рецептов, где они есть.
+    """
+    return Ingredient.objects.filter(pk__in=ingredient_ids).annotate(
+        recipes_count=Count('recipe_ingredients'),
+    ).filter(
+        recipes_count__lte=posting_limit(Recipe.objects.count()),
+    ).values('pk')
+
+
+def with_ingredients(ingredient_ids):
+    return RecipeIngredient.objects.filter(
+        ingredient_id__in=rare_ingredients(ingredient_ids),
+    ).values('recipe_id')
+
+
+def mark_outdated(recipe_ids):
+    """Пометка рецептов, у которых изменился состав ингредиентов.
+
+    Помечаются и рецепты, у которых могут измениться похожие: с общими
+    нечастыми ингредиентами и те, у кого изменённые рецепты уже среди
+    похожих.
+    """
+    Recipe.objects.filter(
+        Q(pk__in=recipe_ids)
+        | Q(pk__in=with_ingredients(RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).values('ingredient_id')))
+        | Q(pk__in=SimilarRecipe.objects.filter(
+            similar_id__in=recipe_ids,
+        ).values('recipe_id')),
+    ).update(similar_updated=None)
+
+
+def mark_ingredients_outdated(ingredient_ids):
+    """Пометка рецептов с ингредиентами, удалёнными из других рецептов."""
+    Recipe.objects.filter(
+        pk__in=with_ingredients(ingredient_ids),
+    ).update(similar_updated=None)
+
+
+def load_matrix():
+    """Разреженная матрица рецепт × ингредиент в виде множеств
+    ингредиентов рецептов и обратного индекса по ингредиентам."""
+    recipes = defaultdict(set)
+    postings = defaultdict(list)
+    for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+        'recipe_id', 'ingredient_id',
+    ).iterator():
+        recipes[recipe_id].add(ingredient_id)
+        postings[ingredient_id].append(recipe_id)
+    return recipes, postings
+
+
+def similarity(common, size, other_size, metric):
+    if metric == 'cosine':
+        return common / math.sqrt(size * other_size)
+    return common / (size + other_size - common)
+
+
+def neighbours(recipe_id, recipes, postings, top, metric, max_postings):
+    """Top-K похожих рецептов по числу общих ингредиентов.
+
+    Кандидаты собираются по обратному индексу; слишком частые
+    ингредиенты (соль, вода) в поиске кандидатов не участвуют, но
+    учитываются в оценке сходства.
+    """
+    ingredients = recipes.get(recipe_id, ())
+    candidates = Counter()
+    for ingredient_id in ingredients:
+        posting = postings[ingredient_id]
+        if len(posting) <= max_postings:
+            candidates.update(posting)
+    candidates.pop(recipe_id, None)
+    scored = []
+    for other_id in candidates:
+        other = recipes[other_id]
+        scored.append((
+            similarity(
+                len(ingredients & other), len(ingredients), len(other),
+                metric,
+            ),
+            other_id,
+        ))
+    scored.sort(key=lambda item: (-item[0], -item[1]))
+    return scored[:top]
+
+
+def build(recipe_ids=None, top=10, metric='jaccard', max_df=MAX_DF,
+          batch_size=500):
+    """Пересчёт похожих рецептов.
+
+    Без recipe_ids пересчитываются рецепты, помеченные как устаревшие
+    или ещё не обработанные. Возвращает число обработанных рецептов.
+    """
+    recipes, postings = load_matrix()
+    max_postings = posting_limit(len(recipes), max_df)
+    if recipe_ids is None:
+        recipe_ids = Recipe.objects.filter(
+            similar_updated__isnull=True,
+        ).values_list('pk', flat=True)
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), batch_size):
+        batch = recipe_ids[start:start + batch_size]
+        rows = [
+            SimilarRecipe(recipe_id=recipe_id, similar_id=other_id,
+                          score=score)
+            for recipe_id in batch
+            for score, other_id in neighbours(
+                recipe_id, recipes, postings, top, metric, max_postings,
+            )
+            if score > 0
+        ]
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=batch).delete()
+            SimilarRecipe.objects.bulk_create(rows)
+            Recipe.objects.filter(pk__in=batch).update(
+                similar_updated=timezone.now(),
+            )
+    return len(recipe_ids)
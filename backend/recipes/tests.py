@@ -0,0 +1,134 @@
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase
+from recipes import similar
+from recipes.batching import on_commit_once
+from recipes.indexes import MemoryIndex
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+User = get_user_model()
+
+
+@mock.patch.object(similar, 'MIN_MAX_POSTINGS', 0)
+class MarkOutdatedTests(TestCase):
+    """Пометка рецептов для инкрементального пересчёта похожих."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов', password='password12',
+        )
+        salt, flour, sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'мука', 'сахар')
+        )
+        cls.recipes = []
+        for index in range(10):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {index}', text='Описание',
+                cooking_time=5, image=f'recipes/images/recipe{index}.png',
+            )
+            # Соль есть во всех рецептах, мука — в двух, сахар — в одном.
+            ingredients = [salt] + [flour] * (index < 2) + [sugar] * (
+                index == 9
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=1)
+                for ingredient in ingredients
+            )
+            cls.recipes.append(recipe)
+
+    def outdated(self):
+        return set(Recipe.objects.filter(
+            similar_updated__isnull=True,
+        ).values_list('pk', flat=True))
+
+    def test_frequent_ingredient_does_not_mark_catalog(self):
+        similar.build(recipe_ids=[recipe.pk for recipe in self.recipes])
+        self.assertEqual(self.outdated(), set())
+        similar.mark_outdated([self.recipes[0].pk])
+        self.assertEqual(
+            self.outdated(), {self.recipes[0].pk, self.recipes[1].pk},
+        )
+
+    def test_marks_recipes_listing_changed_recipe(self):
+        similar.build(
+            recipe_ids=[recipe.pk for recipe in self.recipes], max_df=1,
+        )
+        listing = set(Recipe.objects.filter(
+            similar_recipes__similar=self.recipes[9],
+        ).values_list('pk', flat=True))
+        self.assertTrue(listing)
+        similar.mark_outdated([self.recipes[9].pk])
+        self.assertEqual(self.outdated(), listing | {self.recipes[9].pk})
+
+
+class OnCommitOnceTests(TestCase):
+    """Накопление идентификаторов до коммита транзакции."""
+
+    def test_merges_ids_and_drops_rolled_back(self):
+        handler = mock.Mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            on_commit_once(handler, [2])
+            on_commit_once(handler, [1, 2])
+            with self.assertRaises(ValueError), transaction.atomic():
+                on_commit_once(handler, [3])
+                raise ValueError
+            with transaction.atomic():
+                on_commit_once(handler, [4])
+        handler.assert_has_calls([mock.call([1, 2]), mock.call([4])])
+        self.assertEqual(handler.call_count, 2)
+
+
+class SlowIndex(MemoryIndex):
+
+    def __init__(self):
+        super().__init__(ttl=60)
+        self.builds = 0
+        self.release = threading.Event()
+
+    def _build(self):
+        self.builds += 1
+        if self.builds > 1:
+            self.release.wait(5)
+        return self.builds
+
+
+class MemoryIndexTests(SimpleTestCase):
+    """Перестройка устаревшего индекса в памяти процесса."""
+
+    def expire(self, index):
+        index._built_at -= index.ttl + 1
+
+    def test_serves_stale_state_during_single_rebuild(self):
+        index = SlowIndex()
+        self.assertEqual(index._get_state(), 1)
+        self.expire(index)
+        with mock.patch('recipes.indexes.connection'):
+            for _ in range(5):
+                self.assertEqual(index._get_state(), 1)
+            self.assertTrue(index._rebuilding)
+            index.release.set()
+            while index._rebuilding:
+                time.sleep(0.01)
+        self.assertEqual(index._get_state(), 2)
+        self.assertEqual(index.builds, 2)
+
+    def test_rebuild_does_not_overwrite_newer_state(self):
+        index = SlowIndex()
+        index._get_state()
+        self.expire(index)
+        with mock.patch('recipes.indexes.connection'):
+            index._get_state()
+            with index._lock:
+                index._set_state('refreshed')
+            index.release.set()
+            while index._rebuilding:
+                time.sleep(0.01)
+        self.assertEqual(index._get_state(), 'refreshed')
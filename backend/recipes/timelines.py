@@ -0,0 +1,162 @@
+import heapq
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from recipes.models import Recipe, TimelineEntry
+from users.models import Subscription
+
+User = get_user_model()
+
+
+def insert(entries):
+    """Пакетная вставка записей ленты без дубликатов."""
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == settings.FEED_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def is_popular(author_id):
+    """Популярным авторам лента при публикации не раскладывается."""
+    return User.objects.filter(
+        pk=author_id,
+        followers_count__gte=settings.FEED_POPULAR_FOLLOWERS,
+    ).exists()
+
+
+def fan_out(recipe):
+    """Раскладка нового рецепта по лентам подписчиков автора."""
+    if is_popular(recipe.author_id):
+        return
+    follower_ids = Subscription.objects.filter(
+        author_id=recipe.author_id,
+    ).values_list('user_id', flat=True).iterator()
+    entries = (
+        TimelineEntry(
+            user_id=user_id,
+            recipe_id=recipe.pk,
+            author_id=recipe.author_id,
+            pub_date=recipe.pub_date,
+        )
+        for user_id in follower_ids
+    )
+    insert(entries)
+
+
+def backfill(user_id, author_id):
+    """Добавление в ленту подписчика уже опубликованных рецептов автора.
+
+    Выполняется и для популярных авторов: если автор перестанет быть
+    популярным, его старые рецепты останутся в ленте.
+    """
+    insert(
+        TimelineEntry(
+            user_id=user_id, recipe_id=pk, author_id=author_id,
+            pub_date=pub_date,
+        )
+        for pk, pub_date in Recipe.objects.filter(
+            author_id=author_id,
+        ).values_list('pk', 'pub_date').iterator()
+    )
+
+
+def backfill_followers(author_id):
+    """Раскладка всех рецептов автора по лентам его подписчиков.
+
+    Нужна, когда автор перестаёт быть популярным: рецепты, вышедшие за
+    время популярности, в ленты не раскладывались, а при чтении их
+    больше не подмешивают.
+    """
+    recipes = list(Recipe.objects.filter(
+        author_id=author_id,
+    ).values_list('pk', 'pub_date'))
+    follower_ids = Subscription.objects.filter(
+        author_id=author_id,
+    ).values_list('user_id', flat=True).iterator()
+    insert(
+        TimelineEntry(
+            user_id=user_id, recipe_id=pk, author_id=author_id,
+            pub_date=pub_date,
+        )
+        for user_id in follower_ids
+        for pk, pub_date in recipes
+    )
+
+
+def prune(user_id, author_id):
+    """Удаление рецептов автора из ленты бывшего подписчика."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild():
+    """Полная пересборка лент по текущим подпискам.
+
+    Нужна после массовой загрузки данных, которая обходит сигналы.
+    Возвращает количество созданных записей.
+    """
+    TimelineEntry.objects.all().delete()
+    rows = Subscription.objects.filter(
+        author__recipes__isnull=False,
+    ).values_list(
+        'user_id', 'author__recipes', 'author_id', 'author__recipes__pub_date',
+    ).iterator()
+    insert(
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                      author_id=author_id, pub_date=pub_date)
+        for user_id, recipe_id, author_id, pub_date in rows
+    )
+    return TimelineEntry.objects.count()
+
+
+def after_position(position, date_field, id_field):
+    """Условие «строго после позиции (pub_date, id)» при сортировке по
+    убыванию."""
+    pub_date, pk = position
+    return Q(**{f'{date_field}__lt': pub_date}) | Q(**{
+        date_field: pub_date, f'{id_field}__lt': pk,
+    })
+
+
+def feed_page(user, limit, position=None):
+    """Страница ленты подписок: [(pub_date, recipe_id)] по убыванию.
+
+    Записи ленты читаются по индексу (user, -pub_date, -recipe) от
+    позиции курсора, рецепты популярных авторов выбираются отдельно по
+    индексу (author, -pub_date, -id), и обе последовательности
+    сливаются.
+    """
+    timeline = TimelineEntry.objects.filter(user=user)
+    if position:
+        timeline = timeline.filter(
+            after_position(position, 'pub_date', 'recipe'),
+        )
+    sources = [timeline.order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id',
+    )[:limit]]
+    popular = list(Subscription.objects.filter(
+        user=user,
+        author__followers_count__gte=settings.FEED_POPULAR_FOLLOWERS,
+    ).values_list('author_id', flat=True))
+    if popular:
+        recipes = Recipe.objects.filter(author__in=popular)
+        if position:
+            recipes = recipes.filter(
+                after_position(position, 'pub_date', 'id'),
+            )
+        sources.append(recipes.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id',
+        )[:limit])
+    page = []
+    # Старые рецепты популярного автора могут быть и в ленте.
+    for row in heapq.merge(*sources, reverse=True):
+        if page and page[-1] == row:
+            continue
+        page.append(row)
+        if len(page) == limit:
+            break
+    return page
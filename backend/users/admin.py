@@ -11,6 +11,7 @@ class UserAdmin(BaseUserAdmin):
     list_display = (
         'id', 'email', 'username',
         'first_name', 'last_name',
+        'recipes_count', 'followers_count',
         'is_staff',
     )
     list_filter = ('is_staff', 'is_superuser', 'is_active')
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-17 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_thumb',
+            field=models.ImageField(blank=True, editable=False, upload_to='users/avatars/variants/', verbose_name='Миниатюра аватара'),
+        ),
+    ]
@@ -32,6 +32,22 @@ class User(AbstractUser):
         null=True,
         verbose_name='Аватар',
     )
+    avatar_thumb = models.ImageField(
+        upload_to='users/avatars/variants/',
+        blank=True,
+        editable=False,
+        verbose_name='Миниатюра аватара',
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков',
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -74,6 +90,12 @@ class Subscription(models.Model):
                 name='prevent_self_subscription',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='subscription_author_user_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'